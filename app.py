@@ -1,31 +1,39 @@
-print("Flask imported successfully")
-from flask import jsonify
 import json
-from flask import Flask, render_template, request, redirect, url_for, session, flash, jsonify
+from flask import Flask, render_template, request, redirect, url_for, session, flash, jsonify, g, has_app_context, has_request_context, stream_with_context, send_from_directory, send_file
+from werkzeug.security import safe_join
+from werkzeug.exceptions import RequestEntityTooLarge
+from markupsafe import escape
 import sqlite3
-import uuid
+import secrets
 import random
 import time
 import os
+import queue
+import multiprocessing
+import threading
+import gzip
+import mimetypes
+import tempfile
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, CancelledError
+from concurrent.futures.process import BrokenProcessPool
+import re
+import io
+import zlib
+import csv
+import hashlib
+import math
+from collections import Counter, OrderedDict
+import click
 from werkzeug.security import generate_password_hash, check_password_hash
-from werkzeug.utils import secure_filename
-from datetime import datetime
-goals = []
-goal_id = 1
+from datetime import datetime, timedelta, timezone
+
+try:
+    from PIL import Image, ImageOps, features
+except ImportError:   # thumbnails are optional
+    Image = None
 app = Flask(__name__)
 app.secret_key = "finance_secret_key"
-# -------- LOAD & SAVE --------
-def load_goals():
-    try:
-        with open("goals.json", "r") as f:
-            return json.load(f)
-    except:
-        return []
-
-def save_goals(goals):
-    with open("goals.json", "w") as f:
-        json.dump(goals, f)
-DATABASE = "instance/database.db"
+DATABASE = os.environ.get("FINANCE_DB", "instance/database.db")
 # ================= JINJA DATE FILTER =================
 @app.template_filter("pretty_date")
 def pretty_date(value):
@@ -34,11 +42,371 @@ def pretty_date(value):
     except:
         return value
 
+# ================= STATIC ASSETS =================
+# `flask build-assets` copies css/js/images into static/dist under
+# content-hashed names (css/style.3f2a1b9c.css), writes .gz (and .br when
+# the brotli package is installed) next to each text asset, and records the
+# mapping in static/dist/manifest.json. Templates keep calling
+# url_for('static', filename=...); when a manifest entry exists the URL
+# points at /assets/<hashed name> instead, served immutable and
+# precompressed. Without a build everything falls back to plain /static.
+ASSET_DIRS = ("css", "js", "images")
+ASSET_DIST = os.path.join("static", "dist")
+ASSET_MANIFEST = os.path.join(ASSET_DIST, "manifest.json")
+COMPRESSIBLE_ASSETS = (".css", ".js", ".svg")
+ASSET_MAX_AGE = 365 * 24 * 3600
+
+try:
+    import brotli
+except ImportError:   # .br variants are optional
+    brotli = None
+
+asset_manifest = {}
+
+def load_asset_manifest():
+    try:
+        with open(ASSET_MANIFEST, "r") as f:
+            asset_manifest.update(json.load(f))
+    except (OSError, ValueError):
+        pass
+
+
+def build_assets():
+    """Fingerprint and precompress static assets. Returns the manifest."""
+    manifest = {}
+
+    for folder in ASSET_DIRS:
+        for root, _, files in os.walk(os.path.join("static", folder)):
+            for name in files:
+                src = os.path.join(root, name)
+                rel = os.path.relpath(src, "static").replace(os.sep, "/")
+
+                with open(src, "rb") as f:
+                    data = f.read()
+
+                stem, ext = os.path.splitext(rel)
+                hashed = f"{stem}.{hashlib.sha256(data).hexdigest()[:12]}{ext}"
+                dest = os.path.join(ASSET_DIST, hashed)
+                os.makedirs(os.path.dirname(dest), exist_ok=True)
+
+                with open(dest, "wb") as f:
+                    f.write(data)
+
+                if ext in COMPRESSIBLE_ASSETS:
+                    with open(dest + ".gz", "wb") as f:
+                        f.write(gzip.compress(data, compresslevel=9, mtime=0))
+                    if brotli is not None:
+                        with open(dest + ".br", "wb") as f:
+                            f.write(brotli.compress(data))
+
+                manifest[rel] = hashed
+
+    with open(ASSET_MANIFEST, "w") as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+
+    return manifest
+
+
+@app.cli.command("build-assets")
+def build_assets_command():
+    """Write fingerprinted, precompressed assets to static/dist."""
+    manifest = build_assets()
+    click.echo(f"{len(manifest)} assets written to {ASSET_DIST}"
+               + ("" if brotli else " (brotli not installed, gzip only)"))
+
+
+def asset_aware_url_for(endpoint, **values):
+    """url_for that swaps static files for their fingerprinted build."""
+    if endpoint == "static" and values.get("filename") in asset_manifest:
+        values["filename"] = asset_manifest[values["filename"]]
+        return url_for("assets", **values)
+    return url_for(endpoint, **values)
+
+app.jinja_env.globals["url_for"] = asset_aware_url_for
+
+
+@app.route("/assets/<path:filename>")
+def assets(filename):
+    # Only fingerprinted builds are immutable; the manifest and the .gz/.br
+    # siblings are reached through their base name, never directly.
+    if filename not in asset_manifest.values():
+        return {"error": "not found"}, 404
+
+    path = safe_join(ASSET_DIST, filename)
+    if path is None or not os.path.isfile(path):
+        return {"error": "not found"}, 404
+
+    mimetype = mimetypes.guess_type(filename)[0] or "application/octet-stream"
+    encoding = None
+
+    for enc, suffix in (("br", ".br"), ("gzip", ".gz")):
+        if request.accept_encodings[enc] and os.path.isfile(path + suffix):
+            path += suffix
+            encoding = enc
+            break
+
+    resp = send_file(os.path.abspath(path), mimetype=mimetype, max_age=ASSET_MAX_AGE)
+    if encoding:
+        resp.headers["Content-Encoding"] = encoding
+    resp.vary.add("Accept-Encoding")
+    resp.cache_control.public = True
+    resp.cache_control.immutable = True
+    return resp
+
 # ---------------- DATABASE ----------------
-def get_db():
-    conn = sqlite3.connect(DATABASE)
+# One connection per request (kept on flask.g), handed back to a small
+# per-process pool when the request ends instead of being closed.
+# With FINANCE_SHARDS=N the signed-in user's ledger lives in one of N shard
+# files and get_db() hands out that shard's connection instead (see
+# SHARDED LEDGER); route code doesn't change.
+DB_POOL_SIZE = 8
+DB_STATEMENT_CACHE = 256
+DB_MMAP_SIZE = 256 * 1024 * 1024
+SHARD_COUNT = int(os.environ.get("FINANCE_SHARDS", 0))
+
+_db_pools = {}   # shard (None = central database) -> LifoQueue
+_db_stats_lock = threading.Lock()
+db_stats = {"opened": 0, "reused": 0, "discarded": 0}
+
+
+class PooledConnection(sqlite3.Connection):
+    """sqlite3 connection whose close() is a no-op while a request owns it.
+
+    Route code keeps calling conn.close() as before; the real release
+    happens in close_db() at the end of the request.
+    """
+    request_bound = False
+    request_stats = None   # set while METRICS_ENABLED and bound to a request
+
+    def close(self):
+        if self.request_bound:
+            return
+        super().close()
+
+    def execute(self, sql, parameters=()):
+        if self.request_stats is None:
+            return super().execute(sql, parameters)
+        start = time.perf_counter()
+        try:
+            return super().execute(sql, parameters)
+        finally:
+            record_query(self.request_stats, sql, time.perf_counter() - start)
+
+    def executemany(self, sql, seq_of_parameters):
+        if self.request_stats is None:
+            return super().executemany(sql, seq_of_parameters)
+        start = time.perf_counter()
+        try:
+            return super().executemany(sql, seq_of_parameters)
+        finally:
+            record_query(self.request_stats, sql, time.perf_counter() - start)
+
+
+def _bump_db_stat(name):
+    with _db_stats_lock:
+        db_stats[name] += 1
+
+
+def _connect(shard=None, path=None):
+    """
+    New connection to the central database, or to a ledger shard with the
+    central database attached (so `users` etc. still resolve).
+    """
+    conn = sqlite3.connect(
+        path or (DATABASE if shard is None else shard_path(shard)),
+        factory=PooledConnection,
+        cached_statements=DB_STATEMENT_CACHE,
+        check_same_thread=False
+    )
     conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute(f"PRAGMA mmap_size={DB_MMAP_SIZE}")
+    conn.execute("PRAGMA busy_timeout=5000")
+    if shard is not None:
+        attach_central(conn)
+    _bump_db_stat("opened")
     return conn
+
+
+def _db_pool(shard):
+    pool = _db_pools.get(shard)
+    if pool is None:
+        pool = _db_pools.setdefault(shard, queue.LifoQueue(maxsize=DB_POOL_SIZE))
+    return pool
+
+
+def get_db(user_id=None):
+    """
+    Connection for user_id's data (default: the signed-in user); the central
+    database when there's no user or sharding is off.
+    """
+    if user_id is None and has_request_context():
+        user_id = session.get("user_id")
+    shard = shard_for(user_id)
+
+    # Outside a request (startup, CLI) hand out a plain connection.
+    if not has_app_context():
+        return _connect(shard)
+
+    conns = g.setdefault("db", {})
+    if shard not in conns:
+        try:
+            conn = _db_pool(shard).get_nowait()
+            _bump_db_stat("reused")
+        except queue.Empty:
+            conn = _connect(shard)
+        conn.request_bound = True
+        conn.request_stats = g.get("metrics")
+        conns[shard] = conn
+    return conns[shard]
+
+
+@app.teardown_appcontext
+def close_db(exc):
+    for shard, conn in g.pop("db", {}).items():
+        conn.request_bound = False
+        conn.request_stats = None
+        try:
+            if conn.in_transaction:
+                conn.rollback()
+            _db_pool(shard).put_nowait(conn)
+        except (sqlite3.Error, queue.Full):
+            _bump_db_stat("discarded")
+            conn.close()
+
+
+# ---------------- METRICS ----------------
+# Opt-in (FINANCE_METRICS=1) per-request SQL tracing: statement count, total
+# SQL time and the slowest statement, plus a latency histogram per route.
+# sqlite3's trace callback only reports when a statement starts, so queries
+# are timed in PooledConnection.execute instead. When disabled the only cost
+# is one attribute check per execute().
+# FINANCE_SLOW_QUERY_MS=<ms> additionally logs every statement slower than that.
+METRICS_ENABLED = os.environ.get("FINANCE_METRICS") == "1"
+SLOW_QUERY_MS = float(os.environ.get("FINANCE_SLOW_QUERY_MS", 0))
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+
+def record_query(stats, sql, elapsed):
+    stats["queries"] += 1
+    stats["sql_seconds"] += elapsed
+    if elapsed > stats["slowest_seconds"]:
+        stats["slowest_seconds"] = elapsed
+        stats["slowest_sql"] = sql
+
+    if SLOW_QUERY_MS and elapsed * 1000 >= SLOW_QUERY_MS:
+        app.logger.warning(
+            "slow query %.1f ms on %s: %s",
+            elapsed * 1000, request.path, " ".join(sql.split())
+        )
+
+
+class RouteMetrics:
+    """Per-route request counters and latency histograms."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.routes = {}
+
+    def observe(self, route, seconds, stats):
+        with self._lock:
+            m = self.routes.setdefault(route, {
+                "count": 0,
+                "seconds": 0.0,
+                "buckets": [0] * len(LATENCY_BUCKETS),
+                "queries": 0,
+                "sql_seconds": 0.0,
+                "slowest_seconds": 0.0,
+                "slowest_sql": ""
+            })
+            m["count"] += 1
+            m["seconds"] += seconds
+            for i, le in enumerate(LATENCY_BUCKETS):
+                if seconds <= le:
+                    m["buckets"][i] += 1
+            m["queries"] += stats["queries"]
+            m["sql_seconds"] += stats["sql_seconds"]
+            if stats["slowest_seconds"] > m["slowest_seconds"]:
+                m["slowest_seconds"] = stats["slowest_seconds"]
+                m["slowest_sql"] = stats["slowest_sql"]
+
+    def render(self):
+        lines = [
+            "# HELP finance_request_duration_seconds Request latency by route.",
+            "# TYPE finance_request_duration_seconds histogram",
+        ]
+        with self._lock:
+            routes = {k: dict(v, buckets=list(v["buckets"])) for k, v in self.routes.items()}
+
+        for route, m in sorted(routes.items()):
+            label = f'route="{route}"'
+            for le, n in zip(LATENCY_BUCKETS, m["buckets"]):
+                lines.append(f'finance_request_duration_seconds_bucket{{{label},le="{le}"}} {n}')
+            lines.append(f'finance_request_duration_seconds_bucket{{{label},le="+Inf"}} {m["count"]}')
+            lines.append(f'finance_request_duration_seconds_sum{{{label}}} {m["seconds"]:.6f}')
+            lines.append(f'finance_request_duration_seconds_count{{{label}}} {m["count"]}')
+
+        for name, key, kind, help_text in (
+            ("finance_sql_queries_total", "queries", "counter", "SQL statements executed."),
+            ("finance_sql_seconds_total", "sql_seconds", "counter", "Time spent in SQL."),
+            ("finance_sql_slowest_seconds", "slowest_seconds", "gauge", "Slowest single statement."),
+        ):
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            for route, m in sorted(routes.items()):
+                lines.append(f'{name}{{route="{route}"}} {m[key]}')
+
+        return lines
+
+route_metrics = RouteMetrics()
+
+
+@app.before_request
+def start_request_metrics():
+    if METRICS_ENABLED:
+        g.metrics = {
+            "start": time.perf_counter(),
+            "queries": 0,
+            "sql_seconds": 0.0,
+            "slowest_seconds": 0.0,
+            "slowest_sql": ""
+        }
+
+
+@app.after_request
+def finish_request_metrics(response):
+    stats = g.get("metrics")
+    if stats is not None:
+        route = request.url_rule.rule if request.url_rule else "unmatched"
+        route_metrics.observe(route, time.perf_counter() - stats["start"], stats)
+    return response
+
+
+@app.route("/metrics")
+def metrics():
+    lines = route_metrics.render()
+
+    lines.append("# TYPE finance_db_connections_total counter")
+    for name, value in db_stats.items():
+        lines.append(f'finance_db_connections_total{{event="{name}"}} {value}')
+
+    lines.append("# TYPE finance_aggregate_cache_total counter")
+    for name, value in aggregate_cache.stats.items():
+        lines.append(f'finance_aggregate_cache_total{{event="{name}"}} {value}')
+
+    lines.append("# TYPE finance_sse_clients gauge")
+    lines.append(f"finance_sse_clients {event_broker.clients}")
+
+    lines.append("# TYPE finance_user_cache_total counter")
+    for name, value in user_cache.stats.items():
+        lines.append(f'finance_user_cache_total{{event="{name}"}} {value}')
+
+    return app.response_class(
+        "\n".join(lines) + "\n", mimetype="text/plain; version=0.0.4"
+    )
+
+
 def ui_to_db_date(date_str):
     """
     Accepts:
@@ -58,9 +426,7 @@ def ui_to_db_date(date_str):
     except ValueError:
         raise ValueError("Invalid date format")
 
-def init_db():
-    conn = get_db()
-
+def init_db(conn):
     # USERS TABLE
     conn.execute("""
         CREATE TABLE IF NOT EXISTS users (
@@ -72,15 +438,12 @@ def init_db():
         )
     """)
 
-    # RESET TOKENS TABLE
-    conn.execute("""
-        CREATE TABLE IF NOT EXISTS reset_tokens (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            email TEXT NOT NULL,
-            token TEXT NOT NULL
-        )
-    """)
+    # RESET TOKENS TABLE → see init_reset_tokens()
+
+    init_ledger_tables(conn)
 
+
+def init_ledger_tables(conn):
     # ✅ ADD THIS (INCOME TABLE)
     conn.execute("""
         CREATE TABLE IF NOT EXISTS income (
@@ -106,20 +469,351 @@ def init_db():
         )
     """)
 
+# ---------------- MONTH KEY + INDEXES ----------------
+# `month` is a virtual generated column ('YYYY-MM'), so existing rows get it
+# for free and it can be indexed instead of grouping on strftime(date).
+LEDGER_INDEXES = [
+    "CREATE INDEX IF NOT EXISTS idx_{t}_user_date ON {t} (user_id, date)",
+    "CREATE INDEX IF NOT EXISTS idx_{t}_user_month ON {t} (user_id, month, amount)",
+    "CREATE INDEX IF NOT EXISTS idx_{t}_user_category ON {t} (user_id, {c})",
+]
+
+def add_month_columns(conn):
+    for table, category in (("income", "source"), ("expenses", "category")):
+        cols = [r["name"] for r in conn.execute(f"PRAGMA table_xinfo({table})")]
+        if "month" not in cols:
+            conn.execute(f"""
+                ALTER TABLE {table}
+                ADD COLUMN month TEXT
+                GENERATED ALWAYS AS (substr(date, 1, 7)) VIRTUAL
+            """)
+
+        for ddl in LEDGER_INDEXES:
+            conn.execute(ddl.format(t=table, c=category))
+
+
+def month_bounds(date_str):
+    """Half-open [first day of month, first day of next month) for a DB date."""
+    start = datetime.strptime(date_str[:7], "%Y-%m")
+    if start.month == 12:
+        end = start.replace(year=start.year + 1, month=1)
+    else:
+        end = start.replace(month=start.month + 1)
+    return start.strftime("%Y-%m-%d"), end.strftime("%Y-%m-%d")
 
-    conn.commit()
-    conn.close()
 
-init_db()
+# ---------------- DATE RANGES ----------------
+# Every range filter goes through resolve_range(), which turns a named range
+# or a custom from/to into half-open [start, end) 'YYYY-MM-DD' bounds (None
+# means unbounded). Callers compare the raw date column with >= and <, so
+# the filters can seek idx_*_user_date / the rollup's month index, and they
+# bind the bounds as parameters, so each query shape is compiled once per
+# connection and served from its statement cache.
+# Named ranges follow the UTC calendar, like SQLite's date('now').
+NAMED_RANGES = ("month", "6months", "quarter", "ytd", "year", "all", "custom")
+
+
+def add_months(day, n):
+    """First day of the month n months after day's month."""
+    year, month = divmod(day.month - 1 + n, 12)
+    return day.replace(year=day.year + year, month=month + 1, day=1)
+
+
+def resolve_range(name, date_from=None, date_to=None, today=None):
+    """
+    Named range, or "custom" with inclusive from/to dates (DD/MM/YYYY or
+    YYYY-MM-DD, either optional) -> (start, end).
+    Raises ValueError for unknown names, bad dates or from after to.
+    """
+    today = today or datetime.now(timezone.utc).date()
+    this_month = today.replace(day=1)
+
+    if name == "month":
+        start, end = this_month, add_months(this_month, 1)
+    elif name == "6months":   # this month and the five before it
+        start, end = add_months(this_month, -5), add_months(this_month, 1)
+    elif name == "quarter":
+        start = add_months(this_month, -((this_month.month - 1) % 3))
+        end = add_months(start, 3)
+    elif name == "ytd":
+        start, end = this_month.replace(month=1), today + timedelta(days=1)
+    elif name == "year":
+        start = this_month.replace(month=1)
+        end = start.replace(year=start.year + 1)
+    elif name == "all":
+        return None, None
+    elif name == "custom":
+        start = ui_to_db_date(date_from) if date_from else None
+        end = next_day(ui_to_db_date(date_to)) if date_to else None
+        if start and end and start >= end:
+            raise ValueError("from date is after to date")
+        return start, end
+    else:
+        raise ValueError(f"unknown range {name!r}")
+
+    return start.isoformat(), end.isoformat()
+
+
+# ---------------- MONTHLY ROLLUP ----------------
+# Per (user, month, kind, category) totals. Triggers on income/expenses keep
+# it in step inside the same transaction as the write, so every write path
+# (routes, upsert_salary, anything added later) is covered automatically.
+# Income rows use `source` as their category.
+ROLLUP_SOURCES = (("income", "income", "source"), ("expense", "expenses", "category"))
+
+ROLLUP_ADD = """
+    INSERT INTO monthly_rollup (user_id, month, kind, category, total, count)
+    VALUES (NEW.user_id, substr(NEW.date, 1, 7), '{kind}', NEW.{c}, NEW.amount, 1)
+    ON CONFLICT (user_id, month, kind, category)
+    DO UPDATE SET total = total + excluded.total, count = count + 1;
+"""
+
+ROLLUP_REMOVE = """
+    UPDATE monthly_rollup
+    SET total = total - OLD.amount, count = count - 1
+    WHERE user_id = OLD.user_id AND month = substr(OLD.date, 1, 7)
+    AND kind = '{kind}' AND category = OLD.{c};
+
+    DELETE FROM monthly_rollup
+    WHERE user_id = OLD.user_id AND month = substr(OLD.date, 1, 7)
+    AND kind = '{kind}' AND category = OLD.{c} AND count <= 0;
+"""
+
+def init_rollup(conn):
+    exists = conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type='table' AND name='monthly_rollup'"
+    ).fetchone()
+
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS monthly_rollup (
+            user_id INTEGER NOT NULL,
+            month TEXT NOT NULL,
+            kind TEXT NOT NULL,
+            category TEXT NOT NULL,
+            total REAL NOT NULL DEFAULT 0,
+            count INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (user_id, month, kind, category)
+        ) WITHOUT ROWID
+    """)
+
+    for kind, table, c in ROLLUP_SOURCES:
+        add = ROLLUP_ADD.format(kind=kind, c=c)
+        remove = ROLLUP_REMOVE.format(kind=kind, c=c)
+        conn.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS trg_{table}_rollup_insert
+            AFTER INSERT ON {table} BEGIN {add} END
+        """)
+        conn.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS trg_{table}_rollup_delete
+            AFTER DELETE ON {table} BEGIN {remove} END
+        """)
+        conn.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS trg_{table}_rollup_update
+            AFTER UPDATE OF user_id, amount, date, {c} ON {table}
+            BEGIN {remove} {add} END
+        """)
+
+    if not exists:
+        rebuild_rollup(conn)
+
+
+def rebuild_rollup(conn):
+    """Recompute monthly_rollup from the raw ledger (caller commits)."""
+    conn.execute("DELETE FROM monthly_rollup")
+    for kind, table, c in ROLLUP_SOURCES:
+        conn.execute(f"""
+            INSERT INTO monthly_rollup (user_id, month, kind, category, total, count)
+            SELECT user_id, month, '{kind}', {c}, SUM(amount), COUNT(*)
+            FROM {table}
+            GROUP BY user_id, month, {c}
+        """)
+
+
+def verify_rollup(conn):
+    """Rows where monthly_rollup disagrees with the raw ledger."""
+    return conn.execute("""
+        WITH raw AS (
+            SELECT user_id, month, 'income' AS kind, source AS category,
+                   SUM(amount) AS total, COUNT(*) AS count
+            FROM income
+            GROUP BY user_id, month, source
+
+            UNION ALL
+
+            SELECT user_id, month, 'expense', category, SUM(amount), COUNT(*)
+            FROM expenses
+            GROUP BY user_id, month, category
+        )
+        SELECT r.user_id, r.month, r.kind, r.category,
+               r.total AS raw_total, m.total AS rollup_total
+        FROM raw r
+        LEFT JOIN monthly_rollup m
+            ON m.user_id = r.user_id AND m.month = r.month
+            AND m.kind = r.kind AND m.category = r.category
+        WHERE m.count IS NULL OR m.count != r.count
+        OR abs(m.total - r.total) > 0.005
+
+        UNION ALL
+
+        SELECT m.user_id, m.month, m.kind, m.category, NULL, m.total
+        FROM monthly_rollup m
+        LEFT JOIN raw r
+            ON r.user_id = m.user_id AND r.month = m.month
+            AND r.kind = m.kind AND r.category = m.category
+        WHERE r.count IS NULL
+    """).fetchall()
+
+
+@app.cli.command("rollup")
+@click.argument("action", type=click.Choice(["verify", "rebuild"]))
+def rollup_command(action):
+    """Reconcile monthly_rollup against the income/expenses tables."""
+    mismatches = []
+    for conn in ledger_connections():
+        if action == "rebuild":
+            rebuild_rollup(conn)
+            conn.commit()
+
+        mismatches += verify_rollup(conn)
+        conn.close()
+
+    for r in mismatches:
+        click.echo(
+            f"user={r['user_id']} {r['month']} {r['kind']}/{r['category']}: "
+            f"raw={r['raw_total']} rollup={r['rollup_total']}"
+        )
+    click.echo(f"{len(mismatches)} mismatched rollup rows")
+
+    if mismatches:
+        raise SystemExit(1)
+
+
+def split_month_range(start, end):
+    """
+    Split [start, end) for rollup reads.
+    Returns:
+    - (full_from, edges): whole months are those >= full_from and before
+      end's month; edges are partial-month (lo, hi) date ranges
+    """
+    full_from = start
+    if start and not start.endswith("-01"):
+        full_from = month_bounds(start)[1]
+
+    edges = []
+    if start and full_from != start:
+        edge_end = full_from if not end or full_from < end else end
+        edges.append((start, edge_end))
+    if end and not end.endswith("-01") and not (start and end[:7] == start[:7]):
+        edges.append((end[:7] + "-01", end))
+
+    return full_from, edges
+
+
+def get_rollup_months(conn, user_id, start=None, end=None):
+    """
+    Monthly income/expense totals for dates in [start, end).
+    Returns:
+    - {"YYYY-MM": {"income": x, "expense": y}}
+
+    Whole months come from monthly_rollup; a partial month at either edge
+    of the range is summed from the raw rows via idx_*_user_date.
+    """
+    totals = {}
+
+    def add(month, kind, total):
+        row = totals.setdefault(month, {"income": 0.0, "expense": 0.0})
+        row[kind] += float(total or 0)
+
+    full_from, edges = split_month_range(start, end)
+
+    # Whole months inside the range
+    query = "SELECT month, kind, SUM(total) AS total FROM monthly_rollup WHERE user_id=?"
+    params = [user_id]
+    if full_from:
+        query += " AND month >= ?"
+        params.append(full_from[:7])
+    if end:
+        query += " AND month < ?"
+        params.append(end[:7])
+    query += " GROUP BY month, kind"
+
+    for r in conn.execute(query, params):
+        add(r["month"], r["kind"], r["total"])
+
+    # Partial edge months
+    for lo, hi in edges:
+        rows = conn.execute("""
+            SELECT 'income' AS kind, month, SUM(amount) AS total
+            FROM income
+            WHERE user_id=? AND date >= ? AND date < ?
+            GROUP BY month
+
+            UNION ALL
+
+            SELECT 'expense', month, SUM(amount)
+            FROM expenses
+            WHERE user_id=? AND date >= ? AND date < ?
+            GROUP BY month
+        """, (user_id, lo, hi, user_id, lo, hi))
+        for r in rows:
+            add(r["month"], r["kind"], r["total"])
+
+    return dict(sorted(totals.items()))
+
+
+def get_ledger_summary(conn, user_id, kind, category=None, start=None, end=None):
+    """
+    (total, count) of a user's income or expense rows in [start, end),
+    optionally for one category (source for income). Cost depends on the
+    number of months in range, not the number of rows.
+    """
+    table, c = ("income", "source") if kind == "income" else ("expenses", "category")
+    full_from, edges = split_month_range(start, end)
+
+    query = """
+        SELECT COALESCE(SUM(total), 0), COALESCE(SUM(count), 0)
+        FROM monthly_rollup
+        WHERE user_id=? AND kind=?
+    """
+    params = [user_id, kind]
+    if category:
+        query += " AND category=?"
+        params.append(category)
+    if full_from:
+        query += " AND month >= ?"
+        params.append(full_from[:7])
+    if end:
+        query += " AND month < ?"
+        params.append(end[:7])
+
+    total, count = conn.execute(query, params).fetchone()
+
+    for lo, hi in edges:
+        query = f"""
+            SELECT COALESCE(SUM(amount), 0), COUNT(*)
+            FROM {table}
+            WHERE user_id=? AND date >= ? AND date < ?
+        """
+        params = [user_id, lo, hi]
+        if category:
+            query += f" AND {c}=?"
+            params.append(category)
+
+        edge_total, edge_count = conn.execute(query, params).fetchone()
+        total += edge_total
+        count += edge_count
+
+    return float(total), count
+
 def upsert_salary(user_id, amount, date, description=None):
-    conn = get_db()
+    conn = get_db(user_id)
 
     existing = conn.execute("""
         SELECT id FROM income
         WHERE user_id = ?
+        AND date >= ? AND date < ?
         AND source = 'Salary'
-        AND strftime('%Y-%m', date) = strftime('%Y-%m', ?)
-    """, (user_id, date)).fetchone()
+    """, (user_id, *month_bounds(date))).fetchone()
 
     if existing:
         conn.execute("""
@@ -138,45 +832,35 @@ def upsert_salary(user_id, amount, date, description=None):
 
 
 def get_monthly_income(user_id):
-    conn = get_db()
+    conn = get_db(user_id)
     rows = conn.execute("""
-        SELECT 
-            strftime('%Y', date) AS year,
-            strftime('%m', date) AS month,
-            SUM(amount) AS total
-        FROM income
-        WHERE user_id = ?
-        GROUP BY year, month
-        ORDER BY year, month
+        SELECT month, SUM(total) AS total
+        FROM monthly_rollup
+        WHERE user_id = ? AND kind = 'income'
+        GROUP BY month
+        ORDER BY month
     """, (user_id,)).fetchall()
     conn.close()
 
     result = {}
     for row in rows:
-        key = f"{row['year']}-{row['month']}"
-        result[key] = row["total"]
+        result[row["month"]] = row["total"]
 
     return result
 # ================= MONTHLY SAVINGS CALCULATION =================
 def get_monthly_savings(user_id):
-    conn = get_db()
+    conn = get_db(user_id)
 
+    # One pass over the user's rollup rows: income adds, expense subtracts.
+    # (Joining income and expenses per month multiplied the rows and the sums.)
     rows = conn.execute("""
-        SELECT
-            d.month AS month,
-            COALESCE(SUM(i.amount), 0) - COALESCE(SUM(e.amount), 0) AS savings
-        FROM (
-            SELECT strftime('%Y-%m', date) AS month FROM income WHERE user_id = ?
-            UNION
-            SELECT strftime('%Y-%m', date) AS month FROM expenses WHERE user_id = ?
-        ) d
-        LEFT JOIN income i
-            ON strftime('%Y-%m', i.date) = d.month AND i.user_id = ?
-        LEFT JOIN expenses e
-            ON strftime('%Y-%m', e.date) = d.month AND e.user_id = ?
-        GROUP BY d.month
-        ORDER BY d.month
-    """, (user_id, user_id, user_id, user_id)).fetchall()
+        SELECT month,
+               SUM(CASE WHEN kind = 'income' THEN total ELSE -total END) AS savings
+        FROM monthly_rollup
+        WHERE user_id = ?
+        GROUP BY month
+        ORDER BY month
+    """, (user_id,)).fetchall()
 
     conn.close()
 
@@ -191,41 +875,16 @@ def get_monthly_savings(user_id):
  
 
 def get_monthly_financials(user_id):
-    conn = get_db()
-
-    rows = conn.execute("""
-        SELECT month,
-               SUM(income)  AS income,
-               SUM(expense) AS expense
-        FROM (
-            SELECT strftime('%Y-%m', date) AS month,
-                   SUM(amount) AS income,
-                   0 AS expense
-            FROM income
-            WHERE user_id = ?
-            GROUP BY month
-
-            UNION ALL
-
-            SELECT strftime('%Y-%m', date) AS month,
-                   0 AS income,
-                   SUM(amount) AS expense
-            FROM expenses
-            WHERE user_id = ?
-            GROUP BY month
-        )
-        GROUP BY month
-        ORDER BY month
-    """, (user_id, user_id)).fetchall()
-
+    conn = get_db(user_id)
+    months = get_rollup_months(conn, user_id)
     conn.close()
 
     result = []
-    for r in rows:
-        income = float(r["income"] or 0)
-        expense = float(r["expense"] or 0)
+    for month, r in months.items():
+        income = r["income"]
+        expense = r["expense"]
         result.append({
-            "month": r["month"],
+            "month": month,
             "income": income,
             "expense": expense,
             "savings": income - expense
@@ -258,41 +917,23 @@ def financial_analytics():
     conn = get_db()
 
     # USER
-    user = conn.execute(
-        "SELECT * FROM users WHERE id = ?",
-        (session["user_id"],)
-    ).fetchone()
-
-    # MONTHLY INCOME
-    income_rows = conn.execute("""
-        SELECT strftime('%Y-%m', date) AS month, SUM(amount) AS total
-        FROM income
-        WHERE user_id = ?
-        GROUP BY month
-        ORDER BY month
-    """, (session["user_id"],)).fetchall()
+    user = get_current_user()
 
-    # MONTHLY EXPENSE
-    expense_rows = conn.execute("""
-        SELECT strftime('%Y-%m', date) AS month, SUM(amount) AS total
-        FROM expenses
-        WHERE user_id = ?
-        GROUP BY month
-        ORDER BY month
-    """, (session["user_id"],)).fetchall()
+    # MONTHLY INCOME / EXPENSE
+    monthly = get_rollup_months(conn, session["user_id"])
 
-    income_dict = {r["month"]: float(r["total"]) for r in income_rows}
-    expense_dict = {r["month"]: float(r["total"]) for r in expense_rows}
+    income_dict = {m: r["income"] for m, r in monthly.items()}
+    expense_dict = {m: r["expense"] for m, r in monthly.items()}
 
-    months = sorted(set(income_dict) | set(expense_dict))
+    months = list(monthly)
     income_values = [income_dict.get(m, 0) for m in months]
     expense_values = [expense_dict.get(m, 0) for m in months]
 
     # EXPENSE BREAKDOWN
     breakdown_rows = conn.execute("""
-        SELECT category, SUM(amount) AS total
-        FROM expenses
-        WHERE user_id = ?
+        SELECT category, SUM(total) AS total
+        FROM monthly_rollup
+        WHERE user_id = ? AND kind = 'expense'
         GROUP BY category
     """, (session["user_id"],)).fetchall()
 
@@ -332,6 +973,113 @@ def send_email(to, subject, body):
     print("========================================\n")
 
 
+# ---------------- PASSWORD HASHING ----------------
+# scrypt/pbkdf2 are deliberately slow and hold the GIL while they run, so a
+# burst of logins would stall every other request in the worker. Hashing and
+# verification run in a small process pool instead; the request thread just
+# waits on the future (without the GIL). At most PASSWORD_QUEUE_LIMIT jobs
+# may be queued or running; beyond that the request is refused with a 503
+# rather than piling up.
+#
+# FINANCE_PASSWORD_METHOD is a full werkzeug method string including its cost
+# parameters (e.g. "scrypt:32768:8:1" or "pbkdf2:sha256:1000000"). Stored
+# hashes with any other prefix are rehashed on the next successful login.
+# FINANCE_HASH_WORKERS=0 hashes inline in the request thread.
+PASSWORD_METHOD = os.environ.get("FINANCE_PASSWORD_METHOD", "scrypt:32768:8:1")
+PASSWORD_WORKERS = int(os.environ.get("FINANCE_HASH_WORKERS", min(4, os.cpu_count() or 1)))
+PASSWORD_QUEUE_LIMIT = int(os.environ.get("FINANCE_HASH_QUEUE", max(1, PASSWORD_WORKERS) * 8))
+PASSWORD_TIMEOUT = 10
+
+_hash_pool = None
+_hash_pool_lock = threading.Lock()
+_hash_slots = threading.BoundedSemaphore(PASSWORD_QUEUE_LIMIT)
+
+
+class PasswordHasherBusy(Exception):
+    """The hashing pool is saturated; the client should retry shortly."""
+
+
+def _get_hash_pool():
+    # Created on first use so CLI commands and imports never start workers.
+    # Workers come from a forkserver rather than forking this (threaded,
+    # connection-holding) server process.
+    global _hash_pool
+    with _hash_pool_lock:
+        if _hash_pool is None:
+            _hash_pool = ProcessPoolExecutor(
+                max_workers=PASSWORD_WORKERS,
+                mp_context=multiprocessing.get_context("forkserver")
+            )
+        return _hash_pool
+
+
+def _reset_hash_pool(pool):
+    """
+    Drop a broken or stuck pool; the next call starts a fresh one. Jobs
+    already queued on the old pool keep running, and whatever is still
+    alive once they've had PASSWORD_TIMEOUT to finish (i.e. wedged
+    workers) is killed.
+    """
+    global _hash_pool
+    with _hash_pool_lock:
+        if _hash_pool is not pool:
+            return   # another request already replaced it
+        _hash_pool = None
+
+    processes = list((pool._processes or {}).values())
+    pool.shutdown(wait=False)
+
+    def kill_workers():
+        for process in processes:
+            if process.is_alive():
+                process.kill()
+
+    reaper = threading.Timer(PASSWORD_TIMEOUT, kill_workers)
+    reaper.daemon = True
+    reaper.start()
+
+
+def _run_kdf(fn, *args):
+    if PASSWORD_WORKERS <= 0:
+        return fn(*args)
+
+    if not _hash_slots.acquire(blocking=False):
+        raise PasswordHasherBusy()
+
+    pool = _get_hash_pool()
+    try:
+        future = pool.submit(fn, *args)
+    except (BrokenProcessPool, RuntimeError):
+        # RuntimeError: another request shut this pool down meanwhile
+        _hash_slots.release()
+        _reset_hash_pool(pool)
+        raise PasswordHasherBusy()
+
+    future.add_done_callback(lambda _: _hash_slots.release())
+    try:
+        return future.result(timeout=PASSWORD_TIMEOUT)
+    except (TimeoutError, BrokenProcessPool, CancelledError):
+        # A worker died mid-job or is wedged (or the pool went with it)
+        _reset_hash_pool(pool)
+        raise PasswordHasherBusy()
+
+
+def hash_password(password):
+    return _run_kdf(generate_password_hash, password, PASSWORD_METHOD)
+
+
+def verify_password(stored, password):
+    return _run_kdf(check_password_hash, stored, password)
+
+
+def password_needs_rehash(stored):
+    return stored.split("$", 1)[0] != PASSWORD_METHOD
+
+
+@app.errorhandler(PasswordHasherBusy)
+def password_hasher_busy(exc):
+    return "Too many sign-in attempts right now, please try again in a moment.", 503, {"Retry-After": "1"}
+
 
 # ---------------- REGISTER ----------------
 @app.route("/register", methods=["GET", "POST"])
@@ -346,7 +1094,7 @@ def register():
             flash("Passwords do not match")
             return redirect(url_for("register"))
 
-        hashed = generate_password_hash(password)
+        hashed = hash_password(password)
 
         try:
             conn = get_db()
@@ -365,16 +1113,10 @@ def register():
     return render_template("register.html")
 
 # ---------------- ADD PROFILE PIC COLUMN (ONE TIME) ----------------
-def add_profile_pic_column():
-    conn = get_db()
-    try:
+def add_profile_pic_column(conn):
+    cols = [r["name"] for r in conn.execute("PRAGMA table_info(users)")]
+    if "profile_pic" not in cols:
         conn.execute("ALTER TABLE users ADD COLUMN profile_pic TEXT")
-        conn.commit()
-    except:
-        pass
-    conn.close()
-
-add_profile_pic_column()
 
 # ---------------- LOGIN ----------------
 @app.route("/login", methods=["GET", "POST"])
@@ -389,7 +1131,16 @@ def login():
         ).fetchone()
         conn.close()
 
-        if user and check_password_hash(user["password"], password):
+        if user and verify_password(user["password"], password):
+            if password_needs_rehash(user["password"]):
+                conn = get_db()
+                conn.execute(
+                    "UPDATE users SET password = ? WHERE id = ? AND password = ?",
+                    (hash_password(password), user["id"], user["password"])
+                )
+                conn.commit()
+                conn.close()
+
             # Generate OTP
             otp = str(random.randint(100000, 999999))
             session["otp"] = otp
@@ -481,18 +1232,19 @@ def change_password():
             "SELECT * FROM users WHERE id = ?", (session["user_id"],)
         ).fetchone()
 
-        if not check_password_hash(user["password"], old_password):
+        if not verify_password(user["password"], old_password):
             conn.close()
             flash("Old password is incorrect!")
             return redirect(url_for("change_password"))
 
-        hashed = generate_password_hash(new_password)
+        hashed = hash_password(new_password)
         conn.execute(
             "UPDATE users SET password = ? WHERE id = ?",
             (hashed, session["user_id"])
         )
         conn.commit()
         conn.close()
+        invalidate_user(session["user_id"])
 
         flash("Password updated successfully!")
         return redirect(url_for("dashboard"))
@@ -501,19 +1253,109 @@ def change_password():
     return render_template("change_password.html")
 
 
+# ---------------- RESET TOKENS ----------------
+# Only the SHA-256 of a reset token is stored, under a unique index, so a
+# lookup is one index probe and a leaked table can't be replayed. Each email
+# has at most one row: requesting a new link replaces the previous token.
+# Expired rows are purged in small batches, opportunistically from /forgot
+# at most every RESET_TOKEN_PURGE_INTERVAL seconds and via
+# `flask purge-reset-tokens`.
+RESET_TOKEN_TTL = 30 * 60
+RESET_TOKEN_PURGE_INTERVAL = 10 * 60
+RESET_TOKEN_PURGE_BATCH = 1000
+
+_last_token_purge = 0.0
+
+
+def init_reset_tokens(conn):
+    cols = [r["name"] for r in conn.execute("PRAGMA table_info(reset_tokens)")]
+    if cols and "token_hash" not in cols:
+        # Old plaintext, never-expiring tokens can't be carried over.
+        conn.execute("DROP TABLE reset_tokens")
+
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS reset_tokens (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            email TEXT NOT NULL UNIQUE,
+            token_hash TEXT NOT NULL UNIQUE,
+            created_at INTEGER NOT NULL,
+            expires_at INTEGER NOT NULL
+        )
+    """)
+    conn.execute("""
+        CREATE INDEX IF NOT EXISTS idx_reset_tokens_expires
+        ON reset_tokens (expires_at)
+    """)
+
+
+def hash_reset_token(token):
+    return hashlib.sha256(token.encode()).hexdigest()
+
+
+def issue_reset_token(conn, email):
+    """Create a token for email, superseding any earlier one."""
+    token = secrets.token_urlsafe(32)
+    now = int(time.time())
+    conn.execute("""
+        INSERT INTO reset_tokens (email, token_hash, created_at, expires_at)
+        VALUES (?, ?, ?, ?)
+        ON CONFLICT (email) DO UPDATE SET
+            token_hash = excluded.token_hash,
+            created_at = excluded.created_at,
+            expires_at = excluded.expires_at
+    """, (email, hash_reset_token(token), now, now + RESET_TOKEN_TTL))
+    return token
+
+
+def get_reset_token(conn, token):
+    return conn.execute("""
+        SELECT id, email FROM reset_tokens
+        WHERE token_hash = ? AND expires_at > ?
+    """, (hash_reset_token(token), int(time.time()))).fetchone()
+
+
+def purge_reset_tokens(conn, batch_size=RESET_TOKEN_PURGE_BATCH):
+    """Delete expired tokens batch by batch. Returns rows deleted."""
+    now = int(time.time())
+    deleted = 0
+    while True:
+        cur = conn.execute("""
+            DELETE FROM reset_tokens WHERE id IN (
+                SELECT id FROM reset_tokens WHERE expires_at <= ? LIMIT ?
+            )
+        """, (now, batch_size))
+        conn.commit()
+        deleted += cur.rowcount
+        if cur.rowcount < batch_size:
+            return deleted
+
+
+def maybe_purge_reset_tokens(conn):
+    global _last_token_purge
+    now = time.time()
+    if now - _last_token_purge >= RESET_TOKEN_PURGE_INTERVAL:
+        _last_token_purge = now
+        purge_reset_tokens(conn)
+
+
+@app.cli.command("purge-reset-tokens")
+def purge_reset_tokens_command():
+    """Delete expired password reset tokens."""
+    conn = get_db()
+    click.echo(f"{purge_reset_tokens(conn)} expired tokens deleted")
+    conn.close()
+
+
 # ---------------- FORGOT PASSWORD ----------------
 @app.route("/forgot", methods=["GET", "POST"])
 def forgot():
     if request.method == "POST":
         email = request.form["email"]
-        token = str(uuid.uuid4())
 
         conn = get_db()
-        conn.execute(
-            "INSERT INTO reset_tokens (email, token) VALUES (?, ?)",
-            (email, token)
-        )
+        token = issue_reset_token(conn, email)
         conn.commit()
+        maybe_purge_reset_tokens(conn)
         conn.close()
 
         reset_link = "http://127.0.0.1:5000/reset/" + token
@@ -534,9 +1376,7 @@ def forgot():
 @app.route("/reset/<token>", methods=["GET", "POST"])
 def reset_password(token):
     conn = get_db()
-    record = conn.execute(
-        "SELECT * FROM reset_tokens WHERE token = ?", (token,)
-    ).fetchone()
+    record = get_reset_token(conn, token)
 
     if not record:
         conn.close()
@@ -551,17 +1391,19 @@ def reset_password(token):
             flash("Passwords do not match")
             return redirect(request.url)
 
-        hashed = generate_password_hash(password)
+        hashed = hash_password(password)
 
-        conn.execute(
-            "UPDATE users SET password = ? WHERE email = ?",
+        updated = conn.execute(
+            "UPDATE users SET password = ? WHERE email = ? RETURNING id",
             (hashed, record["email"])
-        )
+        ).fetchall()
         conn.execute(
-            "DELETE FROM reset_tokens WHERE token = ?", (token,)
+            "DELETE FROM reset_tokens WHERE id = ?", (record["id"],)
         )
         conn.commit()
         conn.close()
+        for row in updated:
+            invalidate_user(row["id"])
 
         flash("Password reset successful. Please login.")
         return redirect(url_for("login"))
@@ -570,45 +1412,221 @@ def reset_password(token):
     return render_template("reset_password.html")
 # ---------------- EDIT PROFILE ----------------
 UPLOAD_FOLDER = "static/uploads"
-os.makedirs(UPLOAD_FOLDER, exist_ok=True)
 
-@app.route("/edit_profile", methods=["GET", "POST"])
-def edit_profile():
-    if "user_id" not in session:
-        return redirect(url_for("login"))
+# ---------------- PROFILE PICTURES ----------------
+# Uploads are streamed to disk in chunks (size-capped), stored under the
+# hash of their content (so identical uploads share one file and users can't
+# overwrite each other), and resized to square thumbnails in a background
+# pool. Hashed files never change, so /media serves them as immutable.
+# Thumbnails need Pillow; without it the original image is served.
+PROFILE_PIC_MAX_BYTES = 5 * 1024 * 1024
+PROFILE_FORM_MAX_BYTES = PROFILE_PIC_MAX_BYTES + 64 * 1024   # + other fields, multipart framing
+UPLOAD_CHUNK = 64 * 1024
+THUMB_FOLDER = os.path.join(UPLOAD_FOLDER, "thumbs")
+THUMB_SIZES = (64, 128, 256)
+MEDIA_MAX_AGE = 365 * 24 * 3600
+HASHED_NAME = re.compile(r"^[0-9a-f]{32}\.(jpg|png|gif|webp)$")
+THUMB_PATH = re.compile(r"^thumbs/[0-9a-f]{32}_[0-9]+\.(jpg|webp)$")
+
+if Image is not None:
+    THUMB_FORMAT, THUMB_EXT = ("WEBP", "webp") if features.check("webp") else ("JPEG", "jpg")
+
+thumbnail_pool = ThreadPoolExecutor(max_workers=2, thread_name_prefix="thumbs")
+
+
+def sniff_image_type(head):
+    """File extension from the first bytes of an upload, or None."""
+    if head.startswith(b"\xff\xd8\xff"):
+        return ".jpg"
+    if head.startswith(b"\x89PNG\r\n\x1a\n"):
+        return ".png"
+    if head[:6] in (b"GIF87a", b"GIF89a"):
+        return ".gif"
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return ".webp"
+    return None
+
+
+def save_profile_pic(file):
+    """
+    Stream an uploaded image into UPLOAD_FOLDER under its content hash.
+    Returns:
+    - the stored filename
+    Raises ValueError for oversized or non-image uploads.
+    """
+    digest = hashlib.sha256()
+    size = 0
+    head = b""
+    fd, tmp_path = tempfile.mkstemp(dir=UPLOAD_FOLDER, prefix=".upload-")
 
-    conn = get_db()
-    user = conn.execute(
-        "SELECT * FROM users WHERE id = ?",
-        (session["user_id"],)
-    ).fetchone()
+    try:
+        with os.fdopen(fd, "wb") as out:
+            while True:
+                chunk = file.stream.read(UPLOAD_CHUNK)
+                if not chunk:
+                    break
+                size += len(chunk)
+                if size > PROFILE_PIC_MAX_BYTES:
+                    raise ValueError("Profile picture must be under 5 MB")
+                if len(head) < 16:
+                    head += chunk[:16 - len(head)]
+                digest.update(chunk)
+                out.write(chunk)
+
+        ext = sniff_image_type(head)
+        if not ext:
+            raise ValueError("Upload a JPEG, PNG, GIF or WebP image")
+
+        filename = digest.hexdigest()[:32] + ext
+        path = os.path.join(UPLOAD_FOLDER, filename)
+
+        if os.path.exists(path):   # same picture uploaded before
+            os.remove(tmp_path)
+        else:
+            os.replace(tmp_path, path)
+    except Exception:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
 
-    if request.method == "POST":
-        name = request.form.get("name")
-        email = request.form.get("email")
+    if Image is not None:
+        thumbnail_pool.submit(make_thumbnails, filename)
+    return filename
 
-        profile_pic = user["profile_pic"]
 
-        if "profile_pic" in request.files:
-            file = request.files["profile_pic"]
-            if file and file.filename:
-                filename = secure_filename(file.filename)
-                file.save(os.path.join("static/uploads", filename))
-                profile_pic = filename
+def thumb_name(filename, size):
+    return f"{os.path.splitext(filename)[0]}_{size}.{THUMB_EXT}"
 
-        conn.execute("""
-            UPDATE users
-            SET name = ?, email = ?, profile_pic = ?
-            WHERE id = ?
-        """, (name, email, profile_pic, session["user_id"]))
 
-        conn.commit()
+def make_thumbnails(filename):
+    try:
+        with Image.open(os.path.join(UPLOAD_FOLDER, filename)) as img:
+            img = ImageOps.exif_transpose(img).convert("RGB")
+
+            for size in THUMB_SIZES:
+                path = os.path.join(THUMB_FOLDER, thumb_name(filename, size))
+                if os.path.exists(path):
+                    continue
+
+                tmp_path = path + ".tmp"
+                ImageOps.fit(img, (size, size)).save(tmp_path, THUMB_FORMAT, quality=85)
+                os.replace(tmp_path, path)
+    except Exception:
+        app.logger.exception("Thumbnail generation failed for %s", filename)
+
+
+@app.template_global()
+def avatar_url(filename, size=128):
+    """Best URL for a profile picture at roughly `size` pixels."""
+    if not filename:
+        return url_for("static", filename="images/default.png")
+
+    if not HASHED_NAME.match(filename):
+        # Pre-hashing uploads keep their old, mutable URL
+        return url_for("static", filename="uploads/" + filename)
+
+    if Image is not None:
+        thumb = thumb_name(filename, size)
+        if os.path.exists(os.path.join(THUMB_FOLDER, thumb)):
+            return url_for("media", filename="thumbs/" + thumb)
+
+    return url_for("media", filename=filename)
+
+
+@app.route("/media/<path:filename>")
+def media(filename):
+    # Only content-addressed files are immutable; legacy names and
+    # trashed-* files stay behind /static/uploads (or nowhere).
+    if not (HASHED_NAME.match(filename) or THUMB_PATH.match(filename)):
+        return {"error": "not found"}, 404
+
+    resp = send_from_directory(UPLOAD_FOLDER, filename, max_age=MEDIA_MAX_AGE)
+    resp.cache_control.public = True
+    resp.cache_control.immutable = True
+    return resp
+
+
+@app.cli.command("cleanup-uploads")
+@click.option("--dry-run", is_flag=True, help="only list what would be removed")
+def cleanup_uploads_command(dry_run):
+    """Delete uploads and thumbnails no user references (e.g. trashed-*)."""
+    conn = get_db()
+    in_use = {
+        r["profile_pic"] for r in conn.execute(
+            "SELECT profile_pic FROM users WHERE profile_pic IS NOT NULL"
+        )
+    }
+    conn.close()
+
+    stems = {os.path.splitext(name)[0] for name in in_use}
+    removed = 0
+
+    for folder in (UPLOAD_FOLDER, THUMB_FOLDER):
+        if not os.path.isdir(folder):
+            continue
+
+        for name in os.listdir(folder):
+            path = os.path.join(folder, name)
+            if name.startswith(".") or not os.path.isfile(path):
+                continue   # in-flight uploads / thumbnails, directories
+
+            if folder == THUMB_FOLDER:
+                orphan = name.rsplit("_", 1)[0] not in stems
+            else:
+                orphan = name not in in_use
+
+            if orphan:
+                click.echo(("would remove " if dry_run else "removed ") + path)
+                if not dry_run:
+                    os.remove(path)
+                removed += 1
+
+    click.echo(f"{removed} orphaned files")
+
+@app.route("/edit_profile", methods=["GET", "POST"])
+def edit_profile():
+    if "user_id" not in session:
+        return redirect(url_for("login"))
+
+    user = get_current_user()
+
+    if request.method == "POST":
+        # Reject oversized bodies before Werkzeug spools them to disk;
+        # save_profile_pic still enforces the limit on the file itself.
+        request.max_content_length = PROFILE_FORM_MAX_BYTES
+        try:
+            name = request.form.get("name")
+            files = request.files
+        except RequestEntityTooLarge:
+            flash("Profile picture must be under 5 MB", "danger")
+            return redirect(url_for("edit_profile"))
+        email = request.form.get("email")
+
+        profile_pic = user["profile_pic"]
+
+        if "profile_pic" in files:
+            file = files["profile_pic"]
+            if file and file.filename:
+                try:
+                    profile_pic = save_profile_pic(file)
+                except ValueError as e:
+                    flash(str(e), "danger")
+                    return redirect(url_for("edit_profile"))
+
+        conn = get_db()
+        conn.execute("""
+            UPDATE users
+            SET name = ?, email = ?, profile_pic = ?
+            WHERE id = ?
+        """, (name, email, profile_pic, session["user_id"]))
+
+        conn.commit()
         conn.close()
+        invalidate_user(session["user_id"])
 
         flash("Profile updated successfully", "success")
         return redirect(url_for("dashboard"))
 
-    conn.close()
     return render_template("edit_profile.html", user=user)
 
 
@@ -625,15 +1643,7 @@ def logout():
 # ---------------- RUN ----------------
 @app.context_processor
 def inject_user():
-    if "user_id" in session:
-        conn = get_db()
-        user = conn.execute(
-            "SELECT * FROM users WHERE id=?",
-            (session["user_id"],)
-        ).fetchone()
-        conn.close()
-        return dict(user=user)
-    return dict(user=None)
+    return dict(user=get_current_user())
 
 @app.route("/income")
 def income_summary():
@@ -647,14 +1657,17 @@ def income_summary():
         (session["user_id"],)
     ).fetchall()
 
-    total = conn.execute(
-        "SELECT COALESCE(SUM(amount), 0) FROM income WHERE user_id = ?",
-        (session["user_id"],)
-    ).fetchone()[0]
+    total = cached_aggregate(
+        conn, session["user_id"], "totals",
+        lambda: get_ledger_totals(conn, session["user_id"])
+    )["income"]
 
-    conn.close()
+    monthly_income = cached_aggregate(
+        conn, session["user_id"], "monthly_income",
+        lambda: get_monthly_income(session["user_id"])
+    )
 
-    monthly_income = get_monthly_income(session["user_id"])
+    conn.close()
 
     return render_template(
         "income_summary.html",
@@ -663,19 +1676,114 @@ def income_summary():
         monthly_income=monthly_income
     )
 
+# ================= PAGINATED LISTS =================
+# Keyset pagination on (date, id), newest first. ?after=<date|id> moves to
+# older rows, ?before=<date|id> back to newer ones; other query args
+# (filters, per_page) are carried over in the pager links.
+LIST_PAGE_SIZES = (10, 25, 50, 100)
+LIST_PAGE_SIZE = 25
+
+def next_day(date_str):
+    return (datetime.strptime(date_str, "%Y-%m-%d") + timedelta(days=1)).strftime("%Y-%m-%d")
+
+
+def get_list_page_args():
+    per_page = request.args.get("per_page", LIST_PAGE_SIZE, type=int)
+    if per_page not in LIST_PAGE_SIZES:
+        per_page = LIST_PAGE_SIZE
+
+    def parse(name):
+        raw = request.args.get(name)
+        if not raw:
+            return None
+        date, row_id = raw.split("|")
+        return ui_to_db_date(date), int(row_id)
+
+    return per_page, parse("after"), parse("before")
+
+
+def get_ledger_page(conn, table, where, params, per_page, after=None, before=None):
+    """
+    One page of `table` rows matching `where`, newest first.
+    Returns:
+    - (rows, newer_cursor, older_cursor); a cursor is None when there is
+      no page in that direction
+    """
+    def cursor_of(row):
+        return f"{row['date']}|{row['id']}"
+
+    if before:
+        rows = conn.execute(f"""
+            SELECT * FROM {table}
+            WHERE {where} AND (date, id) > (?, ?)
+            ORDER BY date ASC, id ASC
+            LIMIT ?
+        """, [*params, *before, per_page + 1]).fetchall()
+
+        has_newer = len(rows) > per_page
+        rows = rows[:per_page][::-1]
+        newer = cursor_of(rows[0]) if has_newer else None
+        older = cursor_of(rows[-1]) if rows else None
+        return rows, newer, older
+
+    query = f"SELECT * FROM {table} WHERE {where}"
+    query_params = list(params)
+    if after:
+        query += " AND (date, id) < (?, ?)"
+        query_params += after
+    query += " ORDER BY date DESC, id DESC LIMIT ?"
+
+    rows = conn.execute(query, query_params + [per_page + 1]).fetchall()
+
+    has_older = len(rows) > per_page
+    rows = rows[:per_page]
+    newer = cursor_of(rows[0]) if after and rows else None
+    older = cursor_of(rows[-1]) if has_older else None
+    return rows, newer, older
+
+
+def build_pager(endpoint, per_page, newer, older, count):
+    args = {
+        k: v for k, v in request.args.items()
+        if k not in ("after", "before", "per_page")
+    }
+
+    return {
+        "count": count,
+        "per_page": per_page,
+        "newer_url": url_for(endpoint, **args, per_page=per_page, before=newer) if newer else None,
+        "older_url": url_for(endpoint, **args, per_page=per_page, after=older) if older else None,
+        "size_urls": [(n, url_for(endpoint, **args, per_page=n)) for n in LIST_PAGE_SIZES]
+    }
+
+
+def income_list_page(endpoint, template):
+    try:
+        per_page, after, before = get_list_page_args()
+    except ValueError:
+        return redirect(url_for(endpoint))
+
+    conn = get_db()
+    incomes, newer, older = get_ledger_page(
+        conn, "income", "user_id = ?", [session["user_id"]],
+        per_page, after, before
+    )
+    _, count = get_ledger_summary(conn, session["user_id"], "income")
+    conn.close()
+
+    return render_template(
+        template,
+        incomes=incomes,
+        pager=build_pager(endpoint, per_page, newer, older, count)
+    )
+
+
 @app.route("/income/list")
 def manage_income():
     if "user_id" not in session:
         return redirect(url_for("login"))
 
-    conn = get_db()
-    incomes = conn.execute(
-        "SELECT * FROM income WHERE user_id = ? ORDER BY date DESC",
-        (session["user_id"],)
-    ).fetchall()
-    conn.close()
-
-    return render_template("manage_income.html", incomes=incomes)
+    return income_list_page("manage_income", "manage_income.html")
 
 @app.route("/income/edit/<int:id>", methods=["GET", "POST"])
 def edit_income(id):
@@ -694,10 +1802,22 @@ def edit_income(id):
 
     if request.method == "POST":
         source = request.form["source"]
-        amount = float(request.form["amount"])
-        date = request.form["date"]   # ✅ FIXED
         description = request.form.get("description")
 
+        try:
+            date = ui_to_db_date(request.form.get("date", ""))
+        except ValueError:
+            conn.close()
+            flash("Use date format DD/MM/YYYY")
+            return redirect(url_for("edit_income", id=id))
+
+        try:
+            amount = float(request.form.get("amount"))
+        except (TypeError, ValueError):
+            conn.close()
+            flash("Invalid amount")
+            return redirect(url_for("edit_income", id=id))
+
         conn.execute("""
             UPDATE income
             SET source=?, amount=?, date=?, description=?
@@ -705,6 +1825,7 @@ def edit_income(id):
         """, (source, amount, date, description, id, session["user_id"]))
 
         conn.commit()
+        publish_transaction(conn, session["user_id"], "income", id)
         conn.close()
 
         flash("Income updated successfully", "success")
@@ -720,14 +1841,7 @@ def delete_income_list():
     if "user_id" not in session:
         return redirect(url_for("login"))
 
-    conn = get_db()
-    incomes = conn.execute(
-        "SELECT * FROM income WHERE user_id = ? ORDER BY date DESC",
-        (session["user_id"],)
-    ).fetchall()
-    conn.close()
-
-    return render_template("delete_income.html", incomes=incomes)
+    return income_list_page("delete_income_list", "delete_income.html")
 
 @app.route("/income/delete/<int:id>")
 def delete_income(id):
@@ -740,6 +1854,7 @@ def delete_income(id):
         (id, session["user_id"])
     )
     conn.commit()
+    publish_transaction(conn, session["user_id"], "income", id)
     conn.close()
 
     flash("Income deleted successfully", "danger")
@@ -755,48 +1870,49 @@ def expense_management():
     category = request.args.get("category")
     custom_category = request.args.get("custom_category")
 
-    from_raw = request.args.get("from_date")
-    to_raw = request.args.get("to_date")
-
-    # ✅ normalize
-    from_date = ui_to_db_date(from_raw) if from_raw else None
-    to_date = ui_to_db_date(to_raw) if to_raw else None
+    # ✅ normalize to a half-open [start, end) range
+    try:
+        start, end = resolve_range(
+            "custom", request.args.get("from_date"), request.args.get("to_date")
+        )
+        per_page, after, before = get_list_page_args()
+    except ValueError:
+        return redirect(url_for("expense_management"))
 
-    query = "SELECT * FROM expenses WHERE user_id=?"
+    where = "user_id=?"
     params = [session["user_id"]]
 
     if category:
         if category == "Other" and custom_category:
-            query += " AND category=?"
-            params.append(custom_category.strip())
-        else:
-            query += " AND category=?"
-            params.append(category)
+            category = custom_category.strip()
+        where += " AND category=?"
+        params.append(category)
 
-    if from_date:
-        query += " AND date >= ?"
-        params.append(from_date)
+    if start:
+        where += " AND date >= ?"
+        params.append(start)
 
-    if to_date:
-        query += " AND date <= ?"
-        params.append(to_date)
-
-    query += " ORDER BY date DESC"
+    if end:
+        where += " AND date < ?"
+        params.append(end)
 
     conn = get_db()
-    expenses = conn.execute(query, params).fetchall()
+    expenses, newer, older = get_ledger_page(
+        conn, "expenses", where, params, per_page, after, before
+    )
 
-    total = conn.execute(
-        "SELECT COALESCE(SUM(amount),0) FROM (" + query + ") AS x",
-        params
-    ).fetchone()[0]
+    # Filtered total/count from the rollup, independent of page position
+    total, count = get_ledger_summary(
+        conn, session["user_id"], "expense", category or None, start, end
+    )
 
     conn.close()
 
     return render_template(
         "expense_management.html",
         expenses=expenses,
-        total=total
+        total=total,
+        pager=build_pager("expense_management", per_page, newer, older, count)
     )
 
 
@@ -833,11 +1949,12 @@ def add_income():
         )
 
         conn = get_db()
-        conn.execute("""
+        cur = conn.execute("""
             INSERT INTO income (user_id, source, amount, date, description)
             VALUES (?, ?, ?, ?, ?)
         """, (session["user_id"], final_source, amount, date, description))
         conn.commit()
+        publish_transaction(conn, session["user_id"], "income", cur.lastrowid)
         conn.close()
 
         flash("Income added successfully")
@@ -860,6 +1977,12 @@ def add_expense():
             flash("Use date format DD/MM/YYYY")
             return redirect(url_for("add_expense"))
 
+        try:
+            amount = float(request.form['amount'])
+        except ValueError:
+            flash("Invalid amount")
+            return redirect(url_for("add_expense"))
+
         final_category = (
             custom_category.strip()
             if category == "Other" and custom_category
@@ -867,20 +1990,25 @@ def add_expense():
         )
 
         conn = get_db()
-        conn.execute("""
+        cur = conn.execute("""
             INSERT INTO expenses (user_id, amount, category, date, note)
             VALUES (?, ?, ?, ?, ?)
         """, (
             session['user_id'],
-            request.form['amount'],
+            amount,
             final_category,
             date,
             request.form['note']
         ))
         conn.commit()
+        publish_transaction(conn, session["user_id"], "expense", cur.lastrowid)
+
+        warning = check_budget(conn, session["user_id"], final_category, date, amount)
         conn.close()
 
         flash("Expense added successfully")
+        if warning:
+            flash(warning, "warning")
         return redirect(url_for("expense_management"))
 
     return render_template('add_expense.html')
@@ -897,6 +2025,7 @@ def delete_expense(id):
         (id, session["user_id"])
     )
     conn.commit()
+    publish_transaction(conn, session["user_id"], "expense", id)
     conn.close()
     flash("Expense deleted successfully", "danger")
     return redirect(url_for("expense_management"))
@@ -907,23 +2036,14 @@ def savings():
         return redirect(url_for("login"))
 
     conn = get_db()
-    cursor = conn.cursor()
-
-    # TOTAL INCOME (ALL TIME)
-    cursor.execute("""
-        SELECT COALESCE(SUM(amount), 0)
-        FROM income
-        WHERE user_id = ?
-    """, (session["user_id"],))
-    total_income = cursor.fetchone()[0]
 
-    # TOTAL EXPENSE (ALL TIME)
-    cursor.execute("""
-        SELECT COALESCE(SUM(amount), 0)
-        FROM expenses
-        WHERE user_id = ?
-    """, (session["user_id"],))
-    total_expense = cursor.fetchone()[0]
+    # TOTAL INCOME / EXPENSE (ALL TIME)
+    totals = cached_aggregate(
+        conn, session["user_id"], "totals",
+        lambda: get_ledger_totals(conn, session["user_id"])
+    )
+    total_income = totals["income"]
+    total_expense = totals["expense"]
 
     # SAVINGS
     total_savings = total_income - total_expense
@@ -938,126 +2058,62 @@ def savings():
     )
 
 
-def get_savings_summary(user_id, range_type):
-    conn = get_db()
-
-    if range_type == "month":
-        date_filter = "date >= date('now','start of month')"
-    elif range_type == "6months":
-        date_filter = "date >= date('now','-6 months')"
-    else:  # year
-        date_filter = "date >= date('now','start of year')"
-
-    # TOTALS
-    income = conn.execute(
-        f"SELECT COALESCE(SUM(amount),0) FROM income WHERE user_id=? AND {date_filter}",
-        (user_id,)
-    ).fetchone()[0]
-
-    expense = conn.execute(
-        f"SELECT COALESCE(SUM(amount),0) FROM expenses WHERE user_id=? AND {date_filter}",
-        (user_id,)
-    ).fetchone()[0]
-
-    # MONTHLY BREAKUP FOR CHART
-    rows = conn.execute(f"""
-        SELECT month,
-               SUM(income)  AS income,
-               SUM(expense) AS expense
-        FROM (
-            SELECT strftime('%Y-%m', date) AS month,
-                   SUM(amount) AS income,
-                   0 AS expense
-            FROM income
-            WHERE user_id=? AND {date_filter}
-            GROUP BY month
-
-            UNION ALL
-
-            SELECT strftime('%Y-%m', date) AS month,
-                   0 AS income,
-                   SUM(amount) AS expense
-            FROM expenses
-            WHERE user_id=? AND {date_filter}
-            GROUP BY month
-        )
-        GROUP BY month
-        ORDER BY month
-    """, (user_id, user_id)).fetchall()
+def get_savings_summary(user_id, range_type, date_from=None, date_to=None):
+    start, end = resolve_range(range_type, date_from, date_to)
 
+    conn = get_db(user_id)
+    summary = build_savings_payload(conn, user_id, start, end)
     conn.close()
 
-    labels = []
-    incomes = []
-    expenses = []
-    savings = []
+    return summary
 
-    for r in rows:
-        labels.append(r["month"])
-        incomes.append(float(r["income"]))
-        expenses.append(float(r["expense"]))
-        savings.append(float(r["income"] - r["expense"]))
 
-    return {
-        "income": income,
-        "expense": expense,
-        "savings": income - expense,
-        "labels": labels,
-        "incomes": incomes,
-        "expenses": expenses,
-        "savings_list": savings
-    }
 @app.route("/api/savings/<range_type>")
 def api_savings(range_type):
+    """Named range, or /api/savings/custom?from=YYYY-MM-DD&to=YYYY-MM-DD."""
     if "user_id" not in session:
         return {"error": "unauthorized"}, 401
 
+    try:
+        start, end = resolve_range(
+            range_type, request.args.get("from"), request.args.get("to")
+        )
+    except ValueError as e:
+        return {"error": str(e)}, 400
+
     user_id = session["user_id"]
     conn = get_db()
 
-    if range_type == "month":
-        date_filter = "strftime('%Y-%m', date) = strftime('%Y-%m', 'now')"
-
-    elif range_type == "6months":
-        date_filter = "date >= date('now','-6 months')"
-
-    elif range_type == "year":
-        # ✅ SHOW ALL DATA (KEY FIX)
-        date_filter = "1=1"
+    # The resolved bounds already move with the calendar
+    version = get_data_version(conn, user_id)
+    etag = make_etag(user_id, version, "api_savings", start, end)
+    if etag_matches(etag):
+        conn.close()
+        return not_modified(etag)
 
-    else:
-        return {"error": "invalid range"}, 400
+    payload = cached_aggregate(
+        conn, user_id, ("api_savings", start, end),
+        lambda: build_savings_payload(conn, user_id, start, end),
+        version
+    )
 
-    rows = conn.execute(f"""
-        SELECT strftime('%Y-%m', date) AS month,
-               SUM(income) AS income,
-               SUM(expense) AS expense
-        FROM (
-            SELECT date, amount AS income, 0 AS expense
-            FROM income
-            WHERE user_id=? AND {date_filter}
+    conn.close()
 
-            UNION ALL
+    return json_with_etag(payload, etag)
 
-            SELECT date, 0 AS income, amount AS expense
-            FROM expenses
-            WHERE user_id=? AND {date_filter}
-        )
-        GROUP BY month
-        ORDER BY month
-    """, (user_id, user_id)).fetchall()
 
-    conn.close()
+def build_savings_payload(conn, user_id, start, end):
+    months = get_rollup_months(conn, user_id, start, end)
 
     labels, incomes, expenses, savings_list = [], [], [], []
     total_income = 0
     total_expense = 0
 
-    for r in rows:
-        inc = float(r["income"] or 0)
-        exp = float(r["expense"] or 0)
+    for month, r in months.items():
+        inc = r["income"]
+        exp = r["expense"]
 
-        labels.append(r["month"])
+        labels.append(month)
         incomes.append(inc)
         expenses.append(exp)
         savings_list.append(inc - exp)
@@ -1075,20 +2131,78 @@ def api_savings(range_type):
         "savings": total_income - total_expense
     }
 # ================= GOALS (FINAL VERSION) =================
-import json
-from flask import request, jsonify, render_template
+GOALS_JSON = "goals.json"
+
+def init_goals(conn):
+    exists = conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type='table' AND name='goals'"
+    ).fetchone()
+
+    init_goals_table(conn)
+
+    # Sharded, the import happens per shard instead (init_shard_goals)
+    if not exists and not SHARD_COUNT:
+        migrate_goals_json(conn)
+
+
+def init_goals_table(conn):
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS goals (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            title TEXT NOT NULL,
+            target REAL NOT NULL,
+            saved REAL NOT NULL DEFAULT 0,
+            priority TEXT NOT NULL DEFAULT 'Medium',
+            date TEXT,
+            FOREIGN KEY (user_id) REFERENCES users(id)
+        )
+    """)
+    conn.execute(
+        "CREATE UNIQUE INDEX IF NOT EXISTS idx_goals_user_id ON goals (user_id, id)"
+    )
 
-# -------- LOAD & SAVE --------
-def load_goals():
-    try:
-        with open("goals.json", "r") as f:
-            return json.load(f)
-    except:
-        return []
 
-def save_goals(goals):
-    with open("goals.json", "w") as f:
-        json.dump(goals, f)
+def migrate_goals_json(conn, shard=None):
+    """
+    One-time import of the old goals.json store (caller commits). With
+    shard set, only that shard's users' goals are imported.
+    """
+    try:
+        with open(GOALS_JSON, "r") as f:
+            old_goals = json.load(f)
+    except (OSError, ValueError):
+        return
+
+    rows = []
+    skipped = 0
+    for g in old_goals if isinstance(old_goals, list) else []:
+        # Unowned or malformed entries can't be attributed to anyone
+        try:
+            if shard is not None and shard_for(int(g["user_id"])) != shard:
+                continue
+            rows.append((
+                int(g["id"]), int(g["user_id"]), str(g["title"]),
+                float(g.get("target", 0)), float(g.get("saved", 0)),
+                g.get("priority", "Medium"), g.get("date")
+            ))
+        except (KeyError, TypeError, ValueError, AttributeError):
+            skipped += 1
+
+    conn.executemany("""
+        INSERT OR IGNORE INTO goals (id, user_id, title, target, saved, priority, date)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+    """, rows)
+    click.echo(f"Migrated {len(rows)} goals from {GOALS_JSON}")
+    if skipped:
+        app.logger.warning("Skipped %d malformed goals in %s", skipped, GOALS_JSON)
+
+
+def get_user_goals(conn, user_id):
+    return conn.execute(
+        "SELECT * FROM goals WHERE user_id = ? ORDER BY id",
+        (user_id,)
+    ).fetchall()
 
 
 # -------- GOALS PAGE --------
@@ -1097,21 +2211,11 @@ def goals_page():
     if "user_id" not in session:
         return redirect(url_for("login"))
 
-    all_goals = load_goals()
-
-    # 🔥 AUTO FIX OLD DATA
-    for g in all_goals:
-        if "user_id" not in g:
-            g["user_id"] = session["user_id"]
-
-    save_goals(all_goals)
-
-    user_goals = [
-        g for g in all_goals
-        if g.get("user_id") == session["user_id"]
-    ]
+    conn = get_db()
+    user_goals = get_user_goals(conn, session["user_id"])
+    conn.close()
 
-    total = sum(g.get("saved", 0) for g in user_goals)
+    total = sum(g["saved"] for g in user_goals)
     active = len(user_goals)
 
     return render_template(
@@ -1127,23 +2231,28 @@ def add_goal():
         return jsonify({"error": "Unauthorized"}), 401
 
     data = request.json
-    goals = load_goals()
 
     if not data.get("title") or not data.get("target"):
         return jsonify({"error": "Missing fields"})
 
-    new_goal = {
-        "id": int(time.time()),  # unique id
-        "user_id": session["user_id"],   # ✅ IMPORTANT
-        "title": data["title"],
-        "target": float(data["target"]),
-        "saved": 0,
-        "priority": data.get("priority", "Medium"),
-        "date": data.get("date")
-    }
+    conn = get_db()
+    cur = conn.execute("""
+        INSERT INTO goals (user_id, title, target, priority, date)
+        VALUES (?, ?, ?, ?, ?)
+    """, (
+        session["user_id"],   # ✅ IMPORTANT
+        data["title"],
+        float(data["target"]),
+        data.get("priority", "Medium"),
+        data.get("date")
+    ))
+    conn.commit()
+    publish_goal(conn, session["user_id"], cur.lastrowid)
 
-    goals.append(new_goal)
-    save_goals(goals)
+    new_goal = dict(conn.execute(
+        "SELECT * FROM goals WHERE id = ?", (cur.lastrowid,)
+    ).fetchone())
+    conn.close()
 
     return jsonify({"success": True, "goal": new_goal})
 
@@ -1156,20 +2265,32 @@ def update_goal(id):
     data = request.json
     amount = float(data.get("amount", 0))
 
-    goals = load_goals()
+    if amount <= 0:
+        return jsonify({"error": "Invalid amount"})
 
-    for g in goals:
-        if g["id"] == id and g["user_id"] == session["user_id"]:
+    conn = get_db()
 
-            if amount <= 0:
-                return jsonify({"error": "Invalid amount"})
+    # Check-and-add in one statement so concurrent deposits can't overshoot
+    cur = conn.execute("""
+        UPDATE goals
+        SET saved = saved + ?
+        WHERE id = ? AND user_id = ? AND saved + ? <= target
+    """, (amount, id, session["user_id"], amount))
+    conn.commit()
 
-            if g["saved"] + amount > g["target"]:
-                return jsonify({"error": "Amount exceeds target"})
+    if cur.rowcount == 0:
+        goal = conn.execute(
+            "SELECT 1 FROM goals WHERE id = ? AND user_id = ?",
+            (id, session["user_id"])
+        ).fetchone()
+        conn.close()
 
-            g["saved"] += amount
+        if not goal:
+            return jsonify({"error": "Goal not found"}), 404
+        return jsonify({"error": "Amount exceeds target"})
 
-    save_goals(goals)
+    publish_goal(conn, session["user_id"], id)
+    conn.close()
     return jsonify({"success": True})
 
 
@@ -1179,89 +2300,1455 @@ def delete_goal(id):
     if "user_id" not in session:
         return jsonify({"error": "Unauthorized"}), 401
 
-    goals = load_goals()
-
-    goals = [
-        g for g in goals
-        if not (g["id"] == id and g["user_id"] == session["user_id"])
-    ]
+    conn = get_db()
+    conn.execute(
+        "DELETE FROM goals WHERE id = ? AND user_id = ?",
+        (id, session["user_id"])
+    )
+    conn.commit()
+    publish_goal(conn, session["user_id"], id)
+    conn.close()
 
-    save_goals(goals)
     return jsonify({"success": True})
 
 
-@app.route("/dashboard-data")
-def dashboard_data():
-
-    # ✅ AUTH CHECK FIRST
-    if "user_id" not in session:
-        return jsonify({"error": "Unauthorized"}), 401
+# ================= AGGREGATE CACHE =================
+# Totals are cached per process under (user_id, data_version, query).
+# data_versions is bumped by triggers on every ledger/goal write, so a write
+# from any worker or route makes older entries unreachable; they simply
+# age out of the LRU. No TTLs needed.
+AGGREGATE_CACHE_SIZE = 2048
+DATA_VERSION_TABLES = ("income", "expenses", "goals")
+
+BUMP_VERSION = """
+    INSERT INTO data_versions (user_id, version) VALUES ({row}.user_id, 1)
+    ON CONFLICT (user_id) DO UPDATE SET version = version + 1;
+"""
+
+class VersionedCache:
+    """Thread-safe LRU with a size bound and hit/miss/eviction counters."""
+
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0, "evictions": 0}
+
+    def get(self, key):
+        with self._lock:
+            if key in self._data:
+                self._data.move_to_end(key)
+                self.stats["hits"] += 1
+                return True, self._data[key]
+            self.stats["misses"] += 1
+            return False, None
+
+    def put(self, key, value):
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.stats["evictions"] += 1
+
+    def pop(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+aggregate_cache = VersionedCache(AGGREGATE_CACHE_SIZE)
+
+
+# ---------------- CURRENT USER ----------------
+# Every page renders the sidebar name/avatar, so the profile fields are
+# cached per process and memoised on g for the rest of the request. Routes
+# that change a user row call invalidate_user(); the TTL bounds how long
+# another worker's copy can lag behind such a change.
+USER_CACHE_SIZE = 4096
+USER_CACHE_TTL = 30
+USER_PROFILE_FIELDS = "id, name, email, profile_pic"
+
+user_cache = VersionedCache(USER_CACHE_SIZE)
+
+
+def get_user_profile(user_id):
+    """{id, name, email, profile_pic} for user_id, or None."""
+    hit, entry = user_cache.get(user_id)
+    if hit and entry[0] > time.monotonic():
+        return entry[1]
 
     conn = get_db()
-
-    # ✅ FIXED COLUMN NAME HERE
-    user = conn.execute(
-        "SELECT name, profile_pic FROM users WHERE id = ?",
-        (session["user_id"],)
+    row = conn.execute(
+        f"SELECT {USER_PROFILE_FIELDS} FROM users WHERE id = ?", (user_id,)
     ).fetchone()
+    conn.close()
 
-    # ================= TOTALS =================
-    income = conn.execute(
-        "SELECT COALESCE(SUM(amount), 0) FROM income WHERE user_id = ?",
-        (session["user_id"],)
-    ).fetchone()[0]
+    profile = dict(row) if row else None
+    user_cache.put(user_id, (time.monotonic() + USER_CACHE_TTL, profile))
+    return profile
 
-    expenses = conn.execute(
-        "SELECT COALESCE(SUM(amount), 0) FROM expenses WHERE user_id = ?",
-        (session["user_id"],)
-    ).fetchone()[0]
 
-    savings = income - expenses
+def get_current_user():
+    if "user_id" not in session:
+        return None
+    if "current_user" not in g:
+        g.current_user = get_user_profile(session["user_id"])
+    return g.current_user
 
-    # ================= TRANSACTIONS =================
-    transactions = conn.execute("""
-        SELECT 'income' as type, amount, date, source as title FROM income
-        WHERE user_id = ?
-        
-        UNION ALL
-        
-        SELECT 'expense' as type, amount, date, category as title FROM expenses
-        WHERE user_id = ?
-        
-        ORDER BY date DESC
-    """, (session["user_id"], session["user_id"])).fetchall()
 
-    # ================= GOALS =================
-    goals_data = load_goals()
-    user_goals = [
-        g for g in goals_data
-        if g.get("user_id") == session["user_id"]
-        ]
-    # ✅ ALWAYS DEFINE goals
-    goals = [
-    {
-        "title": g.get("title"),
-        "target_amount": g.get("target", 0),
-        "saved_amount": g.get("saved", 0)
-    }
-    for g in user_goals
-]
-    conn.close()
+def invalidate_user(user_id):
+    user_cache.pop(user_id)
+    g.pop("current_user", None)
 
-    # ================= RESPONSE =================
-    return jsonify({
-        "income": income,
-        "expenses": expenses,
-        "savings": savings,
-        "transactions": [dict(row) for row in transactions],
-        "goals": goals,
 
-        # ✅ FIXED USER DATA
-        "user_name": user["name"] if user else "User",
-        "user_image": f"/static/uploads/{user['profile_pic']}" if user and user["profile_pic"] else "/static/images/default.png"
-    })
-#===================WELCOME PAGE==============
-# @app.route("/welcome")
+def init_data_versions(conn):
+    init_ledger_versions(conn)
+
+    # Profile fields are part of the dashboard payload too
+    conn.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS trg_users_version_update
+        AFTER UPDATE OF name, profile_pic ON users BEGIN
+            {BUMP_VERSION.format(row="NEW").replace("NEW.user_id", "NEW.id")}
+        END
+    """)
+
+
+def init_ledger_versions(conn):
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS data_versions (
+            user_id INTEGER PRIMARY KEY,
+            version INTEGER NOT NULL DEFAULT 0
+        )
+    """)
+
+    for table in DATA_VERSION_TABLES:
+        conn.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS trg_{table}_version_insert
+            AFTER INSERT ON {table} BEGIN {BUMP_VERSION.format(row="NEW")} END
+        """)
+        conn.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS trg_{table}_version_delete
+            AFTER DELETE ON {table} BEGIN {BUMP_VERSION.format(row="OLD")} END
+        """)
+        conn.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS trg_{table}_version_update
+            AFTER UPDATE ON {table} BEGIN
+                {BUMP_VERSION.format(row="OLD")}
+                {BUMP_VERSION.format(row="NEW")}
+            END
+        """)
+
+
+def get_data_version(conn, user_id):
+    row = conn.execute(
+        "SELECT version FROM data_versions WHERE user_id = ?", (user_id,)
+    ).fetchone()
+    return row["version"] if row else 0
+
+
+def cached_aggregate(conn, user_id, query, compute, version=None):
+    """Return compute() for this user's current data version, cached."""
+    if version is None:
+        version = get_data_version(conn, user_id)
+    key = (user_id, version, query)
+
+    hit, value = aggregate_cache.get(key)
+    if not hit:
+        value = compute()
+        aggregate_cache.put(key, value)
+    return value
+
+
+# ================= CONDITIONAL GET =================
+# JSON endpoints tag responses with the user's data version, so a repeat
+# view is answered with 304 after a single primary-key lookup.
+def make_etag(user_id, version, *parts):
+    raw = json.dumps([user_id, version, *parts], default=str)
+    return hashlib.sha256(raw.encode()).hexdigest()[:32]
+
+
+def etag_matches(etag):
+    return request.if_none_match.contains_weak(etag)
+
+
+def not_modified(etag):
+    resp = app.response_class(status=304)
+    resp.set_etag(etag)
+    resp.headers["Cache-Control"] = "private, no-cache"
+    return resp
+
+
+def json_with_etag(payload, etag):
+    resp = jsonify(payload)
+    resp.set_etag(etag)
+    resp.headers["Cache-Control"] = "private, no-cache"
+    return resp
+
+
+def get_ledger_totals(conn, user_id):
+    """All-time {"income": x, "expense": y} for a user, from the rollup."""
+    totals = {"income": 0.0, "expense": 0.0}
+    for r in conn.execute("""
+        SELECT kind, SUM(total) AS total FROM monthly_rollup
+        WHERE user_id = ?
+        GROUP BY kind
+    """, (user_id,)):
+        totals[r["kind"]] = float(r["total"] or 0)
+    return totals
+
+
+# ================= TRANSACTION FEED =================
+# Keyset pagination over income + expenses, newest first. Rows are ordered
+# by (date, type, id) descending; the cursor is that triple of the last row
+# returned, e.g. "2026-04-02|expense|17".
+DASHBOARD_PAGE_SIZE = 20
+DASHBOARD_MAX_PAGE_SIZE = 100
+
+FEED_SOURCES = (("income", "income", "source"), ("expense", "expenses", "category"))
+
+def parse_feed_cursor(cursor):
+    date, kind, row_id = cursor.split("|")
+    if kind not in ("income", "expense"):
+        raise ValueError("Invalid cursor")
+    return ui_to_db_date(date), kind, int(row_id)
+
+
+def get_transactions_page(conn, user_id, cursor=None, limit=DASHBOARD_PAGE_SIZE):
+    """
+    One page of the user's transactions.
+    Returns:
+    - (rows, next_cursor) where next_cursor is None on the last page
+    """
+    branches = []
+    params = []
+
+    for kind, table, title in FEED_SOURCES:
+        where = "user_id = ?"
+        branch_params = [user_id]
+
+        if cursor:
+            c_date, c_kind, c_id = cursor
+            # Each branch has a fixed type, so the (date, type, id) bound
+            # collapses to a plain range on idx_<table>_user_date.
+            if kind < c_kind:
+                where += " AND date <= ?"
+                branch_params.append(c_date)
+            elif kind == c_kind:
+                where += " AND (date, id) < (?, ?)"
+                branch_params += [c_date, c_id]
+            else:
+                where += " AND date < ?"
+                branch_params.append(c_date)
+
+        branches.append(f"""
+            SELECT * FROM (
+                SELECT '{kind}' AS type, id, amount, date, {title} AS title
+                FROM {table}
+                WHERE {where}
+                ORDER BY date DESC, id DESC
+                LIMIT ?
+            )
+        """)
+        params += branch_params + [limit + 1]
+
+    rows = conn.execute(
+        " UNION ALL ".join(branches)
+        + " ORDER BY date DESC, type DESC, id DESC LIMIT ?",
+        params + [limit + 1]
+    ).fetchall()
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last = rows[-1]
+        next_cursor = f"{last['date']}|{last['type']}|{last['id']}"
+
+    return [dict(r) for r in rows], next_cursor
+
+
+@app.route("/dashboard-data")
+def dashboard_data():
+
+    # ✅ AUTH CHECK FIRST
+    if "user_id" not in session:
+        return jsonify({"error": "Unauthorized"}), 401
+
+    try:
+        limit = int(request.args.get("limit", DASHBOARD_PAGE_SIZE))
+        cursor = request.args.get("cursor")
+        cursor = parse_feed_cursor(cursor) if cursor else None
+    except ValueError:
+        return jsonify({"error": "Invalid cursor or limit"}), 400
+
+    limit = max(1, min(limit, DASHBOARD_MAX_PAGE_SIZE))
+
+    conn = get_db()
+
+    version = get_data_version(conn, session["user_id"])
+    etag = make_etag(session["user_id"], version, "dashboard", cursor, limit)
+    if etag_matches(etag):
+        conn.close()
+        return not_modified(etag)
+
+    # ================= TRANSACTIONS =================
+    transactions, next_cursor = get_transactions_page(
+        conn, session["user_id"], cursor, limit
+    )
+
+    # Later pages only carry transactions
+    if cursor:
+        conn.close()
+        return json_with_etag({
+            "transactions": transactions,
+            "next_cursor": next_cursor
+        }, etag)
+
+    user = get_current_user()
+
+    # ================= TOTALS =================
+    totals = cached_aggregate(
+        conn, session["user_id"], "totals",
+        lambda: get_ledger_totals(conn, session["user_id"]),
+        version
+    )
+
+    income = totals["income"]
+    expenses = totals["expense"]
+    savings = income - expenses
+
+    # ================= GOALS =================
+    goals = [
+        {
+            "id": g["id"],
+            "title": g["title"],
+            "target_amount": g["target"],
+            "saved_amount": g["saved"]
+        }
+        for g in get_user_goals(conn, session["user_id"])
+    ]
+    conn.close()
+
+    # ================= RESPONSE =================
+    return json_with_etag({
+        "income": income,
+        "expenses": expenses,
+        "savings": savings,
+        "transactions": transactions,
+        "next_cursor": next_cursor,
+        "goals": goals,
+
+        # ✅ FIXED USER DATA
+        "user_name": user["name"] if user else "User",
+        "user_image": avatar_url(user["profile_pic"] if user else None, 128)
+    }, etag)
+# ================= LIVE UPDATES (SSE) =================
+# GET /events is a Server-Sent Events stream of small JSON deltas for the
+# signed-in user, published by the write routes right after they commit:
+#   transaction          {id, type, title, amount, date}  (added or edited)
+#   transaction_removed  {id, type}
+#   totals               {income, expenses, savings}      (absolute values)
+#   goal                 {id, title, target_amount, saved_amount}
+#   goal_removed         {id}
+#   resync               {}  (bulk change or dropped messages: refetch)
+# Payloads are absolute rather than increments, so applying one twice (e.g.
+# after a resync) is harmless.
+#
+# Fan-out is in-process: a write only reaches streams held by the same
+# worker process. Each stream is a generator parked on a Condition, not a
+# thread of its own, so under a cooperative server
+#     gunicorn -k gevent --worker-connections 5000 'app:create_app()'
+# idle clients cost a greenlet and a socket. Under sync or threaded workers
+# every open stream pins a worker thread, so a handful of tabs would starve
+# everything else: the stream is only enabled (LIVE_UPDATES, exposed to
+# templates as `live_updates`) under gevent or with FINANCE_LIVE_UPDATES=1,
+# and pages fall back to refetching when they regain focus. Nothing is
+# computed for users with no open stream.
+LIVE_UPDATES = False   # set by create_app()
+SSE_HEARTBEAT = 15
+SSE_RETRY_MS = 5000
+SSE_QUEUE_SIZE = 100
+SSE_MAX_CLIENTS = int(os.environ.get("FINANCE_SSE_MAX_CLIENTS", 5000))
+
+
+def live_updates_enabled():
+    """FINANCE_LIVE_UPDATES=1/0, or by default: is gevent patching sockets?"""
+    setting = os.environ.get("FINANCE_LIVE_UPDATES", "auto")
+    if setting != "auto":
+        return setting == "1"
+    try:
+        from gevent import monkey
+    except ImportError:
+        return False
+    return monkey.is_module_patched("socket")
+
+
+@app.context_processor
+def inject_live_updates():
+    return dict(live_updates=LIVE_UPDATES)
+
+
+def format_sse(event, data):
+    return f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
+
+
+class Subscription:
+    """One open stream: a bounded message buffer plus a wake-up signal."""
+
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self._messages = []
+        self._cond = threading.Condition()
+
+    def push(self, message):
+        with self._cond:
+            if len(self._messages) >= self.maxsize:
+                # Too far behind to catch up message by message
+                self._messages = [format_sse("resync", {})]
+            else:
+                self._messages.append(message)
+            self._cond.notify()
+
+    def drain(self, timeout):
+        """Wait up to timeout for messages; returns them (maybe [])."""
+        with self._cond:
+            if not self._messages:
+                self._cond.wait(timeout)
+            messages, self._messages = self._messages, []
+        return messages
+
+
+class EventBroker:
+    """In-process pub/sub of per-user events."""
+
+    def __init__(self, max_clients):
+        self.max_clients = max_clients
+        self._lock = threading.Lock()
+        self._subscribers = {}
+        self.clients = 0
+
+    def subscribe(self, user_id):
+        with self._lock:
+            if self.clients >= self.max_clients:
+                return None
+            sub = Subscription(SSE_QUEUE_SIZE)
+            self._subscribers.setdefault(user_id, set()).add(sub)
+            self.clients += 1
+            return sub
+
+    def unsubscribe(self, user_id, sub):
+        with self._lock:
+            subs = self._subscribers.get(user_id)
+            if subs and sub in subs:
+                subs.discard(sub)
+                self.clients -= 1
+                if not subs:
+                    del self._subscribers[user_id]
+
+    def has_subscribers(self, user_id):
+        return user_id in self._subscribers
+
+    def publish(self, user_id, event, data):
+        with self._lock:
+            subs = list(self._subscribers.get(user_id, ()))
+        if subs:
+            message = format_sse(event, data)
+            for sub in subs:
+                sub.push(message)
+
+event_broker = EventBroker(SSE_MAX_CLIENTS)
+
+
+def publish_totals(conn, user_id):
+    totals = cached_aggregate(
+        conn, user_id, "totals", lambda: get_ledger_totals(conn, user_id)
+    )
+    event_broker.publish(user_id, "totals", {
+        "income": totals["income"],
+        "expenses": totals["expense"],
+        "savings": totals["income"] - totals["expense"]
+    })
+
+
+def publish_transaction(conn, user_id, kind, row_id):
+    """After a committed add/edit/delete of one income or expense row."""
+    if not event_broker.has_subscribers(user_id):
+        return
+
+    table, title = {k: (t, c) for k, t, c in FEED_SOURCES}[kind]
+    row = conn.execute(f"""
+        SELECT id, {title} AS title, amount, date
+        FROM {table} WHERE id = ? AND user_id = ?
+    """, (row_id, user_id)).fetchone()
+
+    if row:
+        event_broker.publish(user_id, "transaction", dict(row, type=kind))
+    else:
+        event_broker.publish(user_id, "transaction_removed", {"id": row_id, "type": kind})
+    publish_totals(conn, user_id)
+
+
+def publish_goal(conn, user_id, goal_id):
+    """After a committed add/update/delete of one goal."""
+    if not event_broker.has_subscribers(user_id):
+        return
+
+    goal = conn.execute(
+        "SELECT id, title, target, saved FROM goals WHERE id = ? AND user_id = ?",
+        (goal_id, user_id)
+    ).fetchone()
+
+    if goal:
+        event_broker.publish(user_id, "goal", {
+            "id": goal["id"],
+            "title": goal["title"],
+            "target_amount": goal["target"],
+            "saved_amount": goal["saved"]
+        })
+    else:
+        event_broker.publish(user_id, "goal_removed", {"id": goal_id})
+
+
+def event_stream(user_id, sub):
+    try:
+        yield f"retry: {SSE_RETRY_MS}\n\n"
+        while True:
+            messages = sub.drain(SSE_HEARTBEAT)
+            # The comment line doubles as a liveness probe: writing to a
+            # closed socket ends the generator and runs the cleanup below.
+            yield "".join(messages) if messages else ": keepalive\n\n"
+    finally:
+        event_broker.unsubscribe(user_id, sub)
+
+
+@app.route("/events")
+def events():
+    if not LIVE_UPDATES:
+        return jsonify({"error": "Live updates are disabled"}), 404
+    if "user_id" not in session:
+        return jsonify({"error": "Unauthorized"}), 401
+
+    # Nothing request-bound (session, g, the pooled connection) is touched
+    # inside the generator; the request context is gone by the time it runs.
+    user_id = session["user_id"]
+    sub = event_broker.subscribe(user_id)
+    if sub is None:
+        return jsonify({"error": "Too many open streams"}), 503, {"Retry-After": "30"}
+
+    return app.response_class(
+        event_stream(user_id, sub),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
+# ================= BULK CSV IMPORT =================
+# Expected columns (header row required):
+#   type,date,amount,category,note
+# type is "income" or "expense"; for income rows category/note are stored as
+# source/description. Dates may be DD/MM/YYYY or YYYY-MM-DD.
+#
+# Rows are parsed one at a time and written in chunks with executemany, one
+# transaction per chunk. Each imported row stores a hash of its content and
+# a unique index skips rows that were already imported, so re-importing an
+# overlapping statement is safe. Identical rows within one file (two coffees
+# on the same day) are told apart by their occurrence number, so they're
+# all kept and a re-import still skips each of them.
+#
+# Uploads are decoded line by line: a line that isn't valid UTF-8 (e.g. a
+# cp1252 bank export) is reported as a row error instead of aborting.
+IMPORT_BATCH_SIZE = 500
+IMPORT_MAX_ERRORS = 100
+
+def add_import_hash_columns(conn):
+    for table in ("income", "expenses"):
+        cols = [r["name"] for r in conn.execute(f"PRAGMA table_xinfo({table})")]
+        if "import_hash" not in cols:
+            conn.execute(f"ALTER TABLE {table} ADD COLUMN import_hash TEXT")
+
+        conn.execute(f"""
+            CREATE UNIQUE INDEX IF NOT EXISTS idx_{table}_import_hash
+            ON {table} (user_id, import_hash)
+            WHERE import_hash IS NOT NULL
+        """)
+
+
+def parse_import_row(row):
+    """CSV dict row -> (kind, date, amount, category, note, import_hash)"""
+    kind = (row.get("type") or "").strip().lower()
+    if kind not in ("income", "expense"):
+        raise ValueError("type must be income or expense")
+
+    date = ui_to_db_date((row.get("date") or "").strip())
+
+    try:
+        amount = float(row.get("amount") or "")
+    except ValueError:
+        raise ValueError("Invalid amount")
+    if not math.isfinite(amount):
+        raise ValueError("Invalid amount")
+
+    category = (row.get("category") or "").strip()
+    if not category:
+        raise ValueError("category is required")
+
+    note = (row.get("note") or "").strip() or None
+
+    raw = f"{kind}|{date}|{amount:.2f}|{category}|{note or ''}"
+    import_hash = hashlib.sha256(raw.encode()).hexdigest()
+
+    return kind, date, amount, category, note, import_hash
+
+
+def import_transactions(conn, user_id, lines, batch_size=IMPORT_BATCH_SIZE):
+    """
+    Import CSV lines (bytes or text) for one user.
+    Returns:
+    - {"inserted", "duplicates", "error_count", "errors"}
+      errors lists the first IMPORT_MAX_ERRORS as {"line", "error"}
+    """
+    summary = {"inserted": 0, "duplicates": 0, "error_count": 0, "errors": []}
+    incomes, expenses = [], []
+    occurrences = Counter()
+
+    def row_error(line, message):
+        summary["error_count"] += 1
+        if len(summary["errors"]) < IMPORT_MAX_ERRORS:
+            summary["errors"].append({"line": line, "error": message})
+
+    def decoded(lines):
+        for n, line in enumerate(lines, 1):
+            if isinstance(line, bytes):
+                try:
+                    line = line.decode("utf-8-sig" if n == 1 else "utf-8")
+                except UnicodeDecodeError:
+                    row_error(n, "Not valid UTF-8; export the file as UTF-8")
+                    line = "\n"   # blank: the reader skips it
+            yield line
+
+    def flush():
+        batch = len(incomes) + len(expenses)
+        inserted = 0
+        if incomes:
+            inserted += conn.executemany("""
+                INSERT OR IGNORE INTO income
+                    (user_id, source, amount, date, description, import_hash)
+                VALUES (?, ?, ?, ?, ?, ?)
+            """, incomes).rowcount
+        if expenses:
+            inserted += conn.executemany("""
+                INSERT OR IGNORE INTO expenses
+                    (user_id, category, amount, date, note, import_hash)
+                VALUES (?, ?, ?, ?, ?, ?)
+            """, expenses).rowcount
+        conn.commit()
+
+        summary["inserted"] += inserted
+        summary["duplicates"] += batch - inserted
+        incomes.clear()
+        expenses.clear()
+
+    reader = csv.DictReader(decoded(lines))
+    for row in reader:
+        try:
+            kind, date, amount, category, note, import_hash = parse_import_row(row)
+        except ValueError as e:
+            row_error(reader.line_num, str(e))
+            continue
+
+        # The first copy keeps the plain content hash, so files imported
+        # before occurrences were counted still dedupe.
+        occurrences[import_hash] += 1
+        if occurrences[import_hash] > 1:
+            import_hash = hashlib.sha256(
+                f"{import_hash}|{occurrences[import_hash]}".encode()
+            ).hexdigest()
+
+        values = (user_id, category, amount, date, note, import_hash)
+        (incomes if kind == "income" else expenses).append(values)
+
+        if len(incomes) + len(expenses) >= batch_size:
+            flush()
+
+    flush()
+    return summary
+
+
+@app.route("/import/transactions", methods=["POST"])
+def import_transactions_upload():
+    if "user_id" not in session:
+        return jsonify({"error": "Unauthorized"}), 401
+
+    file = request.files.get("file")
+    if not file or not file.filename:
+        return jsonify({"error": "No file uploaded"}), 400
+
+    conn = get_db()
+    summary = import_transactions(conn, session["user_id"], file.stream)
+    conn.close()
+
+    if summary["inserted"]:
+        event_broker.publish(session["user_id"], "resync", {})
+
+    return jsonify(summary)
+
+
+@app.cli.command("import-csv")
+@click.argument("user_id", type=int)
+@click.argument("path", type=click.Path(exists=True, dir_okay=False))
+@click.option("--batch-size", default=IMPORT_BATCH_SIZE, show_default=True)
+def import_csv_command(user_id, path, batch_size):
+    """Bulk import a bank-statement CSV for USER_ID."""
+    conn = get_db(user_id)
+    with open(path, "rb") as f:
+        summary = import_transactions(conn, user_id, f, batch_size)
+    conn.close()
+
+    for e in summary["errors"]:
+        click.echo(f"line {e['line']}: {e['error']}")
+    click.echo(
+        f"{summary['inserted']} imported, {summary['duplicates']} duplicates skipped, "
+        f"{summary['error_count']} rows with errors"
+    )
+
+
+# ================= STREAMING EXPORT =================
+# Rows go straight from the SQLite cursor to the client, EXPORT_CHUNK_ROWS at
+# a time, so memory doesn't depend on ledger size. CSV columns match the
+# import format above, so an export can be re-imported as-is.
+EXPORT_CHUNK_ROWS = 500
+EXPORT_COLUMNS = ["type", "date", "amount", "category", "note"]
+
+def export_query(user_id, args):
+    """Build the filtered, date-ordered export query from request args."""
+    branches = []
+    params = []
+
+    kind_filter = args.get("type")
+    start, end = resolve_range("custom", args.get("from_date"), args.get("to_date"))
+    category = args.get("category")
+
+    for kind, table, c, note in (
+        ("income", "income", "source", "description"),
+        ("expense", "expenses", "category", "note"),
+    ):
+        if kind_filter and kind_filter != kind:
+            continue
+
+        where = "user_id = ?"
+        params.append(user_id)
+
+        if start:
+            where += " AND date >= ?"
+            params.append(start)
+        if end:
+            where += " AND date < ?"
+            params.append(end)
+        if category:
+            where += f" AND {c} = ?"
+            params.append(category)
+
+        branches.append(f"""
+            SELECT '{kind}' AS type, id, date, amount, {c} AS category, {note} AS note
+            FROM {table}
+            WHERE {where}
+        """)
+
+    if not branches:
+        raise ValueError("type must be income or expense")
+
+    query = " UNION ALL ".join(branches) + " ORDER BY date, type, id"
+    return query, params
+
+
+def iter_export_rows(conn, query, params):
+    """Yield lists of rows, EXPORT_CHUNK_ROWS at a time, from a live cursor."""
+    cursor = conn.execute(query, params)
+    while True:
+        rows = cursor.fetchmany(EXPORT_CHUNK_ROWS)
+        if not rows:
+            break
+        yield rows
+
+
+def export_csv_chunks(conn, query, params):
+    buf = io.StringIO()
+    writer = csv.writer(buf)
+
+    writer.writerow(EXPORT_COLUMNS)
+    yield buf.getvalue()   # header goes out before the query runs
+
+    for rows in iter_export_rows(conn, query, params):
+        buf.seek(0)
+        buf.truncate()
+        writer.writerows([r[c] for c in EXPORT_COLUMNS] for r in rows)
+        yield buf.getvalue()
+
+
+def export_ndjson_chunks(conn, query, params):
+    yield ""
+    for rows in iter_export_rows(conn, query, params):
+        yield "".join(
+            json.dumps({c: r[c] for c in EXPORT_COLUMNS}) + "\n" for r in rows
+        )
+
+
+def gzip_chunks(chunks):
+    compressor = zlib.compressobj(wbits=31)   # 31 = gzip container
+    for chunk in chunks:
+        data = compressor.compress(chunk.encode())
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+@app.route("/export/transactions.<fmt>")
+def export_transactions(fmt):
+    if "user_id" not in session:
+        return redirect(url_for("login"))
+
+    if fmt == "csv":
+        chunks, mimetype = export_csv_chunks, "text/csv"
+    elif fmt == "ndjson":
+        chunks, mimetype = export_ndjson_chunks, "application/x-ndjson"
+    else:
+        return {"error": "invalid format"}, 404
+
+    try:
+        query, params = export_query(session["user_id"], request.args)
+    except ValueError as e:
+        return {"error": str(e)}, 400
+
+    conn = get_db()
+    body = chunks(conn, query, params)
+    filename = f"transactions.{fmt}"
+
+    if request.args.get("gzip") == "1":
+        body = gzip_chunks(body)
+        mimetype = "application/gzip"
+        filename += ".gz"
+
+    resp = app.response_class(stream_with_context(body), mimetype=mimetype)
+    resp.headers["Content-Disposition"] = f"attachment; filename={filename}"
+    resp.headers["Cache-Control"] = "private, no-store"
+    return resp
+
+
+# ================= RECURRING TRANSACTIONS =================
+# Rules describe a repeating income or expense (salary, rent, subscriptions).
+# `flask run-recurring` materialises every occurrence that has come due for
+# all users in one transaction: a recursive CTE expands each rule from its
+# next_n (index of the next unmaterialised occurrence) up to today, the
+# result is inserted into income/expenses with INSERT ... SELECT, and next_n
+# advances past what was written. Like upsert_salary's one-salary-per-month
+# check, each occurrence is keyed by (rule_id, date) under a unique index,
+# so re-running (or two schedulers racing) never duplicates a period; and
+# since next_n only moves forward, deleting a generated row doesn't bring
+# it back.
+RECURRING_KINDS = {"income": ("income", "source", "description"),
+                   "expense": ("expenses", "category", "note")}
+RECURRING_CADENCES = ("weekly", "monthly", "yearly")
+
+
+def init_recurring(conn):
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS recurring_rules (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            kind TEXT NOT NULL CHECK (kind IN ('income', 'expense')),
+            category TEXT NOT NULL,
+            amount REAL NOT NULL,
+            description TEXT,
+            cadence TEXT NOT NULL CHECK (cadence IN ('weekly', 'monthly', 'yearly')),
+            start_date TEXT NOT NULL,
+            end_date TEXT,
+            next_n INTEGER NOT NULL DEFAULT 0,
+            FOREIGN KEY (user_id) REFERENCES users(id)
+        )
+    """)
+    conn.execute(
+        "CREATE INDEX IF NOT EXISTS idx_recurring_user ON recurring_rules (user_id, id)"
+    )
+
+    for table, _, _ in RECURRING_KINDS.values():
+        cols = [r["name"] for r in conn.execute(f"PRAGMA table_xinfo({table})")]
+        if "rule_id" not in cols:
+            conn.execute(f"ALTER TABLE {table} ADD COLUMN rule_id INTEGER")
+
+        conn.execute(f"""
+            CREATE UNIQUE INDEX IF NOT EXISTS idx_{table}_rule_period
+            ON {table} (rule_id, date)
+            WHERE rule_id IS NOT NULL
+        """)
+
+
+def occurrence_date_sql(n):
+    """
+    SQL for the date of occurrence `n` of the recurring_rules row `r`.
+    Monthly/yearly keep the start date's day of month, clamped to the
+    month's last day (Jan 31 -> Feb 28 -> Mar 31), and always count from
+    start_date so the clamp never drifts.
+    """
+    months = f"(CASE r.cadence WHEN 'yearly' THEN 12 * ({n}) ELSE ({n}) END)"
+    month_start = f"date(r.start_date, 'start of month', '+' || {months} || ' months')"
+    last_day = f"CAST(strftime('%d', {month_start}, '+1 month', '-1 day') AS INTEGER)"
+    day = f"min(CAST(strftime('%d', r.start_date) AS INTEGER), {last_day})"
+    return f"""CASE r.cadence
+        WHEN 'weekly' THEN date(r.start_date, '+' || (7 * ({n})) || ' days')
+        ELSE date({month_start}, '+' || ({day} - 1) || ' days')
+    END"""
+
+
+def run_recurring(conn, today=None):
+    """
+    Materialise all due occurrences of all rules, up to and including today.
+    Returns:
+    - {"income": inserted, "expense": inserted, "rules": rules advanced}
+    """
+    today = today or datetime.now(timezone.utc).date().isoformat()   # as resolve_range
+    summary = {}
+
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        conn.execute("DROP TABLE IF EXISTS temp.recurring_due")
+        conn.execute(f"""
+            CREATE TEMP TABLE recurring_due AS
+            WITH RECURSIVE occ (rule_id, n, date) AS (
+                SELECT r.id, r.next_n, {occurrence_date_sql("r.next_n")}
+                FROM recurring_rules r
+                WHERE r.start_date <= :today
+
+                UNION ALL
+
+                SELECT occ.rule_id, occ.n + 1, {occurrence_date_sql("occ.n + 1")}
+                FROM occ
+                JOIN recurring_rules r ON r.id = occ.rule_id
+                WHERE occ.date <= :today
+                AND (r.end_date IS NULL OR occ.date <= r.end_date)
+            )
+            SELECT occ.rule_id, occ.n, occ.date, r.user_id, r.kind,
+                   r.category, r.amount, r.description
+            FROM occ
+            JOIN recurring_rules r ON r.id = occ.rule_id
+            WHERE occ.date <= :today
+            AND (r.end_date IS NULL OR occ.date <= r.end_date)
+        """, {"today": today})
+
+        for kind, (table, category, text) in RECURRING_KINDS.items():
+            summary[kind] = conn.execute(f"""
+                INSERT INTO {table} (user_id, {category}, amount, date, {text}, rule_id)
+                SELECT user_id, category, amount, date, description, rule_id
+                FROM temp.recurring_due
+                WHERE kind = ?
+                ON CONFLICT DO NOTHING
+            """, (kind,)).rowcount
+
+        summary["rules"] = conn.execute("""
+            UPDATE recurring_rules
+            SET next_n = due.last_n + 1
+            FROM (
+                SELECT rule_id, MAX(n) AS last_n
+                FROM temp.recurring_due
+                GROUP BY rule_id
+            ) AS due
+            WHERE recurring_rules.id = due.rule_id
+        """).rowcount
+
+        conn.execute("DROP TABLE temp.recurring_due")
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+
+    return summary
+
+
+@app.cli.command("run-recurring")
+@click.option("--date", "today", help="Treat this YYYY-MM-DD as today.")
+def run_recurring_command(today):
+    """Create all recurring transactions that have come due."""
+    started = time.perf_counter()
+    summary = {"rules": 0, "income": 0, "expense": 0}
+    today = today or datetime.now(timezone.utc).date().isoformat()   # same day for every shard
+    for conn in ledger_connections():
+        for key, count in run_recurring(conn, today).items():
+            summary[key] += count
+        conn.close()
+    click.echo(
+        f"{summary['income']} income and {summary['expense']} expenses created "
+        f"from {summary['rules']} rules in {time.perf_counter() - started:.2f}s"
+    )
+
+
+def parse_recurring_rule(data):
+    """JSON body -> validated column dict, or raise ValueError."""
+    kind = data.get("kind")
+    if kind not in RECURRING_KINDS:
+        raise ValueError("kind must be income or expense")
+
+    cadence = data.get("cadence", "monthly")
+    if cadence not in RECURRING_CADENCES:
+        raise ValueError("cadence must be weekly, monthly or yearly")
+
+    category = (data.get("category") or "").strip()
+    if not category:
+        raise ValueError("category is required")
+
+    try:
+        amount = float(data.get("amount"))
+    except (TypeError, ValueError):
+        raise ValueError("amount must be a number")
+    if amount <= 0:
+        raise ValueError("amount must be positive")
+
+    start_date = ui_to_db_date(data.get("start_date") or "")
+    end_date = ui_to_db_date(data["end_date"]) if data.get("end_date") else None
+    if end_date and end_date < start_date:
+        raise ValueError("end_date is before start_date")
+
+    return {
+        "kind": kind, "category": category, "amount": amount,
+        "description": data.get("description"), "cadence": cadence,
+        "start_date": start_date, "end_date": end_date
+    }
+
+
+@app.route("/api/recurring", methods=["GET"])
+def list_recurring():
+    if "user_id" not in session:
+        return jsonify({"error": "Unauthorized"}), 401
+
+    conn = get_db()
+    rules = conn.execute(
+        "SELECT * FROM recurring_rules WHERE user_id = ? ORDER BY id",
+        (session["user_id"],)
+    ).fetchall()
+    conn.close()
+
+    return jsonify([dict(r) for r in rules])
+
+
+@app.route("/api/recurring", methods=["POST"])
+def add_recurring():
+    if "user_id" not in session:
+        return jsonify({"error": "Unauthorized"}), 401
+
+    try:
+        rule = parse_recurring_rule(request.get_json(silent=True) or {})
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    conn = get_db()
+    cur = conn.execute("""
+        INSERT INTO recurring_rules
+            (user_id, kind, category, amount, description, cadence, start_date, end_date)
+        VALUES (:user_id, :kind, :category, :amount, :description, :cadence, :start_date, :end_date)
+    """, dict(rule, user_id=session["user_id"]))
+    conn.commit()
+
+    new_rule = dict(conn.execute(
+        "SELECT * FROM recurring_rules WHERE id = ?", (cur.lastrowid,)
+    ).fetchone())
+    conn.close()
+
+    return jsonify({"success": True, "rule": new_rule}), 201
+
+
+@app.route("/api/recurring/<int:id>/delete", methods=["POST"])
+def delete_recurring(id):
+    """Stop a rule. Transactions it already created are kept."""
+    if "user_id" not in session:
+        return jsonify({"error": "Unauthorized"}), 401
+
+    conn = get_db()
+    deleted = conn.execute(
+        "DELETE FROM recurring_rules WHERE id = ? AND user_id = ?",
+        (id, session["user_id"])
+    ).rowcount
+    conn.commit()
+    conn.close()
+
+    if not deleted:
+        return jsonify({"error": "Rule not found"}), 404
+    return jsonify({"success": True})
+
+
+# ================= BUDGETS =================
+# A budget caps one expense category, either for a single month ("YYYY-MM")
+# or every month (month NULL); a month-specific budget overrides the
+# recurring one. Spend is read straight from monthly_rollup, whose triggers
+# already keep per-(user, month, category) totals in step with every expense
+# insert, edit and delete, so checking a budget is a couple of primary-key
+# lookups regardless of how many expenses there are.
+# warn_at is the fraction of the limit at which add_expense starts warning.
+BUDGET_WARN_AT = 0.8
+MONTH_KEY = re.compile(r"^\d{4}-(0[1-9]|1[0-2])$")
+
+
+def init_budgets(conn):
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS budgets (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            category TEXT NOT NULL,
+            month TEXT,
+            limit_amount REAL NOT NULL CHECK (limit_amount > 0),
+            warn_at REAL NOT NULL DEFAULT 0.8 CHECK (warn_at > 0 AND warn_at <= 1),
+            FOREIGN KEY (user_id) REFERENCES users(id)
+        )
+    """)
+    conn.execute("""
+        CREATE UNIQUE INDEX IF NOT EXISTS idx_budgets_user_category_month
+        ON budgets (user_id, category, ifnull(month, ''))
+    """)
+
+
+# Budgets in force for :user_id in :month, one per category
+EFFECTIVE_BUDGETS = """
+    SELECT b.id, b.category, b.limit_amount, b.warn_at, b.month IS NULL AS recurring
+    FROM budgets b
+    WHERE b.user_id = :user_id
+    AND (b.month = :month OR (b.month IS NULL AND NOT EXISTS (
+        SELECT 1 FROM budgets o
+        WHERE o.user_id = b.user_id AND o.category = b.category
+        AND ifnull(o.month, '') = :month
+    )))
+"""
+
+
+def get_budget_status(conn, user_id, month):
+    """
+    Utilisation of every category with a budget or spend in month.
+    Returns:
+    - [{"category", "spent", "limit", "warn_at", "recurring", "budget_id",
+        "utilisation"}], limit/utilisation None for unbudgeted categories
+    """
+    rows = conn.execute(f"""
+        WITH eff AS ({EFFECTIVE_BUDGETS}),
+        spend AS (
+            SELECT category, total
+            FROM monthly_rollup
+            WHERE user_id = :user_id AND month = :month AND kind = 'expense'
+        )
+        SELECT eff.category, eff.id AS budget_id, eff.limit_amount, eff.warn_at,
+               eff.recurring, ifnull(spend.total, 0) AS spent
+        FROM eff
+        LEFT JOIN spend ON spend.category = eff.category
+
+        UNION ALL
+
+        SELECT category, NULL, NULL, NULL, NULL, total
+        FROM spend
+        WHERE category NOT IN (SELECT category FROM eff)
+
+        ORDER BY 1
+    """, {"user_id": user_id, "month": month}).fetchall()
+
+    return [
+        {
+            "category": r["category"],
+            "budget_id": r["budget_id"],
+            "limit": r["limit_amount"],
+            "warn_at": r["warn_at"],
+            "recurring": None if r["recurring"] is None else bool(r["recurring"]),
+            "spent": r["spent"],
+            "utilisation": round(r["spent"] / r["limit_amount"], 4) if r["limit_amount"] else None
+        }
+        for r in rows
+    ]
+
+
+def check_budget(conn, user_id, category, date, amount):
+    """
+    Call after an expense of `amount` on `date` was committed.
+    Returns a warning message if it pushed the category past its warning
+    threshold or its limit, else None.
+    """
+    month = date[:7]
+    row = conn.execute(f"""
+        WITH eff AS ({EFFECTIVE_BUDGETS})
+        SELECT eff.limit_amount, eff.warn_at, ifnull(r.total, 0) AS spent
+        FROM eff
+        LEFT JOIN monthly_rollup r
+            ON r.user_id = :user_id AND r.month = :month
+            AND r.kind = 'expense' AND r.category = eff.category
+        WHERE eff.category = :category
+    """, {"user_id": user_id, "month": month, "category": category}).fetchone()
+
+    if not row:
+        return None
+
+    limit, spent = row["limit_amount"], row["spent"]
+    before = spent - amount
+
+    if before <= limit < spent:
+        return f"{category} budget exceeded: ₹{spent:,.2f} of ₹{limit:,.2f} spent in {month}"
+    if before < limit * row["warn_at"] <= spent <= limit:
+        return f"{category} is at {spent / limit:.0%} of its ₹{limit:,.2f} budget for {month}"
+    return None
+
+
+@app.route("/api/budgets", methods=["GET"])
+def list_budgets():
+    """Budget utilisation for ?month=YYYY-MM (default: this month)."""
+    if "user_id" not in session:
+        return jsonify({"error": "Unauthorized"}), 401
+
+    month = request.args.get("month") or resolve_range("month")[0][:7]
+    if not MONTH_KEY.match(month):
+        return jsonify({"error": "month must be YYYY-MM"}), 400
+
+    conn = get_db()
+    budgets = get_budget_status(conn, session["user_id"], month)
+    conn.close()
+
+    return jsonify({"month": month, "budgets": budgets})
+
+
+@app.route("/api/budgets", methods=["POST"])
+def set_budget():
+    """Create or replace the budget for (category, month or every month)."""
+    if "user_id" not in session:
+        return jsonify({"error": "Unauthorized"}), 401
+
+    data = request.get_json(silent=True) or {}
+    category = (data.get("category") or "").strip()
+    month = data.get("month") or None
+
+    try:
+        limit = float(data.get("limit"))
+        warn_at = float(data.get("warn_at", BUDGET_WARN_AT))
+    except (TypeError, ValueError):
+        return jsonify({"error": "limit and warn_at must be numbers"}), 400
+
+    if not category:
+        return jsonify({"error": "category is required"}), 400
+    if month and not MONTH_KEY.match(month):
+        return jsonify({"error": "month must be YYYY-MM or empty for every month"}), 400
+    if limit <= 0 or not 0 < warn_at <= 1:
+        return jsonify({"error": "limit must be positive and warn_at in (0, 1]"}), 400
+
+    conn = get_db()
+    conn.execute("""
+        INSERT INTO budgets (user_id, category, month, limit_amount, warn_at)
+        VALUES (?, ?, ?, ?, ?)
+        ON CONFLICT (user_id, category, ifnull(month, ''))
+        DO UPDATE SET limit_amount = excluded.limit_amount, warn_at = excluded.warn_at
+    """, (session["user_id"], category, month, limit, warn_at))
+    conn.commit()
+
+    budget = dict(conn.execute("""
+        SELECT * FROM budgets
+        WHERE user_id = ? AND category = ? AND ifnull(month, '') = ?
+    """, (session["user_id"], category, month or "")).fetchone())
+    conn.close()
+
+    return jsonify({"success": True, "budget": budget})
+
+
+@app.route("/api/budgets/<int:id>/delete", methods=["POST"])
+def delete_budget(id):
+    if "user_id" not in session:
+        return jsonify({"error": "Unauthorized"}), 401
+
+    conn = get_db()
+    deleted = conn.execute(
+        "DELETE FROM budgets WHERE id = ? AND user_id = ?",
+        (id, session["user_id"])
+    ).rowcount
+    conn.commit()
+    conn.close()
+
+    if not deleted:
+        return jsonify({"error": "Budget not found"}), 404
+    return jsonify({"success": True})
+
+
+# ================= FULL-TEXT SEARCH =================
+# FTS5 indexes over expense category/note and income source/description,
+# kept in sync by triggers (external-content tables, so the text isn't
+# stored twice). If this SQLite build lacks FTS5, search is disabled.
+# Each row also indexes an owner token "u<user_id>" (the fts_owner generated
+# column) that every query ANDs in. FTS5 intersects the two doclists with
+# seeks, so a common word only costs the signed-in user's matches instead
+# of every user's. Words match whole tokens for the same reason: a prefix
+# term ("amaz*", opt-in) is expanded over all users before the intersect.
+SEARCH_PAGE_SIZE = 20
+SEARCH_MAX_PAGE = 50
+SEARCH_SOURCES = (
+    ("expense", "expenses", "category", "note"),
+    ("income", "income", "source", "description"),
+)
+MONTH_NAMES = {
+    name: f"{i:02d}"
+    for i, names in enumerate((
+        ("jan", "january"), ("feb", "february"), ("mar", "march"),
+        ("apr", "april"), ("may",), ("jun", "june"), ("jul", "july"),
+        ("aug", "august"), ("sep", "sept", "september"), ("oct", "october"),
+        ("nov", "november"), ("dec", "december"),
+    ), start=1)
+    for name in names
+}
+SEARCH_ENABLED = True
+
+def init_search(conn):
+    # Without FTS5 the migration is a no-op and /api/search reports it as
+    # unavailable (create_app checks for the tables).
+    try:
+        for kind, table, title, text in SEARCH_SOURCES:
+            create_search_index(conn, table, title, text)
+    except sqlite3.OperationalError as e:
+        app.logger.warning("Full-text search disabled: %s", e)
+
+
+def init_search_owner(conn):
+    """Upgrade indexes built before the per-user owner column existed."""
+    if not conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE name = 'expenses_fts'"
+    ).fetchone():
+        return   # no FTS5 in this build
+
+    for kind, table, title, text in SEARCH_SOURCES:
+        create_search_index(conn, table, title, text)
+
+
+def create_search_index(conn, table, title, text):
+    """(Re)build {table}_fts with its sync triggers; no-op if current."""
+    fts_cols = [r["name"] for r in conn.execute(f"PRAGMA table_info({table}_fts)")]
+    if "fts_owner" in fts_cols:
+        return
+
+    cols = [r["name"] for r in conn.execute(f"PRAGMA table_xinfo({table})")]
+    if "fts_owner" not in cols:
+        conn.execute(f"""
+            ALTER TABLE {table} ADD COLUMN fts_owner TEXT
+            GENERATED ALWAYS AS ('u' || user_id) VIRTUAL
+        """)
+
+    for trigger in ("insert", "delete", "update"):
+        conn.execute(f"DROP TRIGGER IF EXISTS trg_{table}_fts_{trigger}")
+    conn.execute(f"DROP TABLE IF EXISTS {table}_fts")
+
+    conn.execute(f"""
+        CREATE VIRTUAL TABLE {table}_fts
+        USING fts5({title}, {text}, fts_owner, content='{table}', content_rowid='id')
+    """)
+
+    insert = f"""
+        INSERT INTO {table}_fts (rowid, {title}, {text}, fts_owner)
+        VALUES (NEW.id, NEW.{title}, NEW.{text}, 'u' || NEW.user_id);
+    """
+    delete = f"""
+        INSERT INTO {table}_fts ({table}_fts, rowid, {title}, {text}, fts_owner)
+        VALUES ('delete', OLD.id, OLD.{title}, OLD.{text}, 'u' || OLD.user_id);
+    """
+    conn.execute(f"""
+        CREATE TRIGGER trg_{table}_fts_insert
+        AFTER INSERT ON {table} BEGIN {insert} END
+    """)
+    conn.execute(f"""
+        CREATE TRIGGER trg_{table}_fts_delete
+        AFTER DELETE ON {table} BEGIN {delete} END
+    """)
+    conn.execute(f"""
+        CREATE TRIGGER trg_{table}_fts_update
+        AFTER UPDATE OF {title}, {text}, user_id ON {table} BEGIN {delete} {insert} END
+    """)
+
+    conn.execute(f"INSERT INTO {table}_fts ({table}_fts) VALUES ('rebuild')")
+
+
+def parse_search_query(q):
+    """
+    Free text -> (FTS5 MATCH expression, month number or None).
+    Words are ANDed, "word*" matches as a prefix; a month name ("march")
+    filters on the transaction date instead of matching text.
+    """
+    terms = []
+    month = None
+
+    for word, star in re.findall(r"(\w+)(\*?)", q.lower()):
+        if word in MONTH_NAMES and month is None and not star:
+            month = MONTH_NAMES[word]
+        else:
+            terms.append(f'"{word}"{star}')
+
+    return " ".join(terms), month
+
+
+def highlight(snippet):
+    """Escape a snippet and turn the \x02/\x03 match markers into <mark>."""
+    return str(escape(snippet)).replace("\x02", "<mark>").replace("\x03", "</mark>")
+
+
+@app.route("/api/search")
+def search_transactions():
+    if "user_id" not in session:
+        return jsonify({"error": "Unauthorized"}), 401
+
+    if not SEARCH_ENABLED:
+        return jsonify({"error": "Search is not available"}), 501
+
+    match, month = parse_search_query(request.args.get("q", ""))
+    page = max(1, min(request.args.get("page", 1, type=int), SEARCH_MAX_PAGE))
+
+    if not match:
+        return jsonify({"results": [], "page": page, "has_more": False})
+
+    branches = []
+    params = []
+    owner = f'fts_owner : "u{int(session["user_id"])}"'
+    for kind, table, title, text in SEARCH_SOURCES:
+        where = f"{table}_fts MATCH ? AND t.user_id = ?"
+        params += [f"{owner} AND {{{title} {text}}} : ({match})", session["user_id"]]
+        if month:
+            where += " AND substr(t.date, 6, 2) = ?"
+            params.append(month)
+
+        # Snippets come from the text columns only (never the owner token)
+        branches.append(f"""
+            SELECT '{kind}' AS type, t.id, t.date, t.amount, t.{title} AS title,
+                   snippet({table}_fts, 0, char(2), char(3), '…', 10) AS title_snippet,
+                   snippet({table}_fts, 1, char(2), char(3), '…', 10) AS text_snippet,
+                   bm25({table}_fts, 1.0, 1.0, 0.0) AS rank
+            FROM {table}_fts
+            JOIN {table} t ON t.id = {table}_fts.rowid
+            WHERE {where}
+        """)
+
+    conn = get_db()
+    rows = conn.execute(
+        " UNION ALL ".join(branches) + " ORDER BY rank, date DESC LIMIT ? OFFSET ?",
+        params + [SEARCH_PAGE_SIZE + 1, (page - 1) * SEARCH_PAGE_SIZE]
+    ).fetchall()
+    conn.close()
+
+    results = [
+        {
+            "type": r["type"],
+            "id": r["id"],
+            "date": r["date"],
+            "amount": r["amount"],
+            "title": r["title"],
+            "snippet": highlight(
+                r["text_snippet"] if "\x02" in (r["text_snippet"] or "")
+                else r["title_snippet"]
+            )
+        }
+        for r in rows[:SEARCH_PAGE_SIZE]
+    ]
+
+    return jsonify({
+        "results": results,
+        "page": page,
+        "has_more": len(rows) > SEARCH_PAGE_SIZE
+    })
+
+
+#===================WELCOME PAGE==============
+# @app.route("/welcome")
 # def welcome():
 #     return render_template("welcome.html")
 
@@ -1270,6 +3757,462 @@ def dashboard_data():
 def index():
     return render_template("welcome.html")
 
+
+
+# ================= SCHEMA MIGRATIONS =================
+# The schema version lives in PRAGMA user_version. Each step runs in its own
+# IMMEDIATE transaction together with the version bump, so a crash leaves
+# the database at the last completed step and concurrent runners queue on
+# the write lock, re-read the version, and skip what's already done.
+# Steps 1-10 are the old import-time initialisers; they're idempotent, so a
+# database created before versioning (user_version 0) just replays them.
+# New schema changes get appended here, never edited in place.
+MIGRATIONS = [
+    (1, init_db),
+    (2, add_month_columns),
+    (3, init_rollup),
+    (4, add_profile_pic_column),
+    (5, init_reset_tokens),
+    (6, init_goals),
+    (7, init_data_versions),
+    (8, add_import_hash_columns),
+    (9, init_recurring),
+    (10, init_search),
+    (11, init_budgets),
+    (12, init_search_owner),
+]
+SCHEMA_VERSION = MIGRATIONS[-1][0]
+
+
+def schema_version(conn):
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+
+def run_migrations(conn, migrations=MIGRATIONS):
+    """Apply pending migrations. Returns the versions applied."""
+    applied = []
+
+    for version, migrate in migrations:
+        if schema_version(conn) >= version:
+            continue
+
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            if schema_version(conn) < version:   # another runner may have won
+                migrate(conn)
+                conn.execute(f"PRAGMA user_version = {version}")
+                applied.append(version)
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+
+    return applied
+
+
+@app.cli.command("migrate")
+def migrate_command():
+    """Bring the database schema up to date (run once per deploy)."""
+    for path, applied, version in migrate_all():
+        click.echo(
+            f"Applied migrations {applied[0]}-{applied[-1]}" if applied
+            else "Schema already up to date"
+        )
+        click.echo(f"Schema version {version} ({path})")
+
+
+def migrate_all():
+    """
+    Migrate the central database and, when sharded, every ledger shard.
+    Returns [(path, applied, version)].
+    """
+    os.makedirs(os.path.dirname(DATABASE) or ".", exist_ok=True)
+    results = []
+
+    for path, migrations in migration_targets():
+        conn = _connect(path=path)
+        try:
+            applied = run_migrations(conn, migrations)
+            results.append((path, applied, schema_version(conn)))
+        finally:
+            conn.close()
+
+    return results
+
+
+def migration_targets(count=None):
+    targets = [(DATABASE, MIGRATIONS)]
+    if count is None:
+        count = SHARD_COUNT
+    if count:
+        targets += [(path, LEDGER_MIGRATIONS) for path in ledger_paths(count)]
+    return targets
+
+
+# ================= SHARDED LEDGER =================
+# Optional, off unless FINANCE_SHARDS=N is set. SQLite allows one writer
+# per database file, so with a single file every user's writes queue on the
+# same lock. Whether splitting that lock buys anything depends on the
+# hardware: on a single core the writers are CPU-bound and
+# benchmarks/shard_writers.py shows no gain, so measure on the target
+# machine before turning it on. Sharded, each user's ledger (income, expenses, goals, budgets,
+# recurring rules and the rollup/version/search tables derived from them)
+# lives in ledger-<i>-of-<N>.db next to DATABASE, picked by a hash of the
+# user id. Users and reset tokens stay in the central database.
+#
+# Shard connections have the central database attached as "central", and
+# SQLite resolves unqualified table names in main first, then attached
+# databases, so route SQL runs unchanged: `income` is the shard's table,
+# `users` the central one. Row ids are only unique within a shard; every
+# ledger query is already scoped by user_id, so that's fine.
+#
+# Changing N: stop writes, `flask shards rebalance --to M`, restart with
+# FINANCE_SHARDS=M. Rebalancing copies rows into a fresh layout and leaves
+# the old files in place as a backup, so going back to 0 needs the central
+# ledger tables emptied first.
+LEDGER_TABLES = (
+    "data_versions", "recurring_rules", "income", "expenses", "goals", "budgets"
+)
+
+def init_shard_goals(conn):
+    """Ledger version of init_goals: goals.json rows go to their shard."""
+    exists = conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type='table' AND name='goals'"
+    ).fetchone()
+
+    init_goals_table(conn)
+
+    shard = shard_of_connection(conn)
+    if not exists and shard is not None:   # not e.g. a rebalance staging file
+        migrate_goals_json(conn, shard)
+
+
+def shard_of_connection(conn):
+    """Index of the current layout's shard file conn has open, or None."""
+    path = os.path.abspath(conn.execute("PRAGMA database_list").fetchone()["file"])
+    paths = [os.path.abspath(p) for p in ledger_paths()] if SHARD_COUNT else []
+    return paths.index(path) if path in paths else None
+
+
+# The steps from MIGRATIONS that create ledger tables, keeping their
+# numbers so central and shard files report the same user_version.
+LEDGER_MIGRATIONS = [
+    (1, init_ledger_tables),
+    (2, add_month_columns),
+    (3, init_rollup),
+    (6, init_shard_goals),
+    (7, init_ledger_versions),
+    (8, add_import_hash_columns),
+    (9, init_recurring),
+    (10, init_search),
+    (11, init_budgets),
+    (12, init_search_owner),
+]
+
+
+def shard_for(user_id, count=None):
+    """Shard index holding user_id's ledger, or None when unsharded."""
+    if count is None:
+        count = SHARD_COUNT
+    if not count or user_id is None:
+        return None
+    return zlib.crc32(str(user_id).encode()) % count
+
+
+def shard_path(shard, count=None):
+    return os.path.join(
+        os.path.dirname(DATABASE),
+        f"ledger-{shard + 1}-of-{count or SHARD_COUNT}.db"
+    )
+
+
+def ledger_paths(count=None):
+    """Every file holding ledger rows for a layout (count 0 = unsharded)."""
+    if count is None:
+        count = SHARD_COUNT
+    if not count:
+        return [DATABASE]
+    return [shard_path(i, count) for i in range(count)]
+
+
+def ledger_connections():
+    """Plain connections to each ledger file, for jobs across all users."""
+    for path in ledger_paths():
+        yield _connect(path=path)
+
+
+def attach_central(conn):
+    conn.execute("ATTACH DATABASE ? AS central", (DATABASE,))
+
+    # Profile edits bump the shard's data_versions. Only TEMP triggers may
+    # watch a table in another database.
+    conn.execute(f"""
+        CREATE TEMP TRIGGER IF NOT EXISTS trg_users_version_update
+        AFTER UPDATE OF name, profile_pic ON central.users BEGIN
+            {BUMP_VERSION.format(row="NEW").replace("NEW.user_id", "NEW.id")}
+        END
+    """)
+
+
+def ledger_counts(path):
+    """{table: rows} for one ledger file."""
+    conn = _connect(path=path)
+    try:
+        return {
+            table: conn.execute(f"SELECT count(*) FROM {table}").fetchone()[0]
+            for table in LEDGER_TABLES
+        }
+    finally:
+        conn.close()
+
+
+def copy_ledger(conn, source, where="", params=()):
+    """
+    Copy ledger rows from the attached `source` schema into main (caller
+    handles the transaction). Ids are only unique within one file, so they
+    are shifted past main's current maximum, and income/expenses.rule_id
+    with them. Returns {table: rows copied}.
+    """
+    offsets = {
+        table: conn.execute(f"SELECT ifnull(max(id), 0) FROM main.{table}").fetchone()[0]
+        for table in LEDGER_TABLES if table != "data_versions"
+    }
+
+    copied = {}
+    # data_versions first so the ledger triggers bump the copied versions
+    # instead of starting over (cached ETags stay invalid). A version
+    # already in main (bumped by the central users trigger) is merged past
+    # both. The triggers also rebuild the rollup and search index as rows
+    # arrive.
+    cur = conn.execute(f"""
+        INSERT INTO main.data_versions (user_id, version)
+        SELECT user_id, version FROM {source}.data_versions {where or "WHERE 1"}
+        ON CONFLICT (user_id) DO UPDATE
+        SET version = max(version, excluded.version) + 1
+    """, params)
+    copied["data_versions"] = cur.rowcount
+
+    for table in LEDGER_TABLES:
+        if table == "data_versions":
+            continue
+        columns = [
+            r["name"] for r in conn.execute(f"PRAGMA main.table_xinfo({table})")
+            if not r["hidden"]   # skip generated columns
+        ]
+        values = [
+            f"id + {offsets[table]}" if col == "id"
+            else f"rule_id + {offsets['recurring_rules']}" if col == "rule_id"
+            else col
+            for col in columns
+        ]
+        cur = conn.execute(
+            f"INSERT INTO main.{table} ({', '.join(columns)}) "
+            f"SELECT {', '.join(values)} FROM {source}.{table} {where}",
+            params
+        )
+        copied[table] = cur.rowcount
+
+    return copied
+
+
+def rebalance_ledger(to_count, from_count=None):
+    """
+    Copy every user's ledger rows from the from_count layout into the
+    to_count one (0 = the central database). Targets must be empty.
+
+    Each target is built in a <target>.rebalance staging file and only
+    moved into place once every copy succeeded and the row counts match
+    the source, so a failure leaves the target layout untouched. Row ids
+    may change where a target gets rows from several sources.
+
+    Returns {table: rows copied}; raises ValueError on a bad layout.
+    """
+    if from_count is None:
+        from_count = SHARD_COUNT
+    if to_count == from_count:
+        raise ValueError(f"already using {from_count} shards")
+
+    sources = ledger_paths(from_count)
+    for path in sources:
+        if not os.path.exists(path):
+            raise ValueError(f"{path} is missing")
+
+    # data_versions doesn't count: the central users trigger keeps bumping
+    # it in sharded mode, and copy_ledger merges versions anyway.
+    targets = ledger_paths(to_count)
+    for path in targets:
+        counts = ledger_counts(path) if os.path.exists(path) else {}
+        if any(n for table, n in counts.items() if table != "data_versions"):
+            raise ValueError(f"{path} already has ledger rows")
+
+    expected = dict.fromkeys(LEDGER_TABLES, 0)
+    for path in sources:
+        for table, rows in ledger_counts(path).items():
+            expected[table] += rows
+
+    staged = [f"{path}.rebalance" for path in targets]
+    copied = dict.fromkeys(LEDGER_TABLES, 0)
+    try:
+        for shard, stage in enumerate(staged):
+            remove_db_files(stage)
+            conn = _connect(path=stage)
+            try:
+                run_migrations(conn, LEDGER_MIGRATIONS)
+                conn.create_function("shard_for", 2, shard_for, deterministic=True)
+                where, params = "", ()
+                if to_count:
+                    where, params = "WHERE shard_for(user_id, ?) = ?", (to_count, shard)
+
+                for source in sources:
+                    conn.execute("ATTACH DATABASE ? AS src", (source,))
+                    conn.execute("BEGIN IMMEDIATE")
+                    try:
+                        for table, rows in copy_ledger(conn, "src", where, params).items():
+                            copied[table] += rows
+                        conn.commit()
+                    except Exception:
+                        conn.rollback()
+                        raise
+                    finally:
+                        conn.execute("DETACH DATABASE src")
+            finally:
+                conn.close()
+
+        if copied != expected:
+            raise ValueError(f"copied {copied}, expected {expected}")
+
+        if to_count:
+            for stage, target in zip(staged, targets):
+                remove_db_files(target)
+                os.replace(stage, target)
+        else:
+            # The central database can't be swapped out, but a single
+            # staged file copies over in one transaction.
+            conn = _connect()
+            try:
+                conn.execute("ATTACH DATABASE ? AS src", (staged[0],))
+                conn.execute("BEGIN IMMEDIATE")
+                try:
+                    copy_ledger(conn, "src")
+                    conn.commit()
+                except Exception:
+                    conn.rollback()
+                    raise
+                finally:
+                    conn.execute("DETACH DATABASE src")
+            finally:
+                conn.close()
+    finally:
+        for stage in staged:
+            remove_db_files(stage)
+
+    return copied
+
+
+def remove_db_files(path):
+    """Delete a closed SQLite database and its WAL/shared-memory files."""
+    for name in (path, f"{path}-wal", f"{path}-shm"):
+        if os.path.exists(name):
+            os.remove(name)
+
+
+@app.cli.command("shards")
+@click.argument("action", type=click.Choice(["status", "rebalance"]))
+@click.option("--to", "to_count", type=int, help="Shard count to rebalance into (0 = unsharded).")
+def shards_command(action, to_count):
+    """Show or change how ledger data is split across shard files."""
+    if action == "status":
+        click.echo(f"FINANCE_SHARDS={SHARD_COUNT}")
+        # Sharded, central ledger rows are leftovers (e.g. the copy kept by
+        # a rebalance out of it) that no request reads.
+        for path in ([DATABASE] if SHARD_COUNT else []) + ledger_paths():
+            counts = ledger_counts(path)
+            click.echo(f"{path}: " + ", ".join(f"{t}={n}" for t, n in counts.items()))
+        return
+
+    if to_count is None or to_count < 0:
+        raise click.UsageError("rebalance needs --to N (N >= 0)")
+
+    started = time.perf_counter()
+    try:
+        copied = rebalance_ledger(to_count)
+    except (ValueError, sqlite3.Error) as e:
+        raise click.ClickException(str(e))
+
+    click.echo(", ".join(f"{t}={n}" for t, n in copied.items()))
+    click.echo(
+        f"Copied into {to_count or 'no'} shards in {time.perf_counter() - started:.2f}s; "
+        f"restart with FINANCE_SHARDS={to_count}"
+    )
+
+
+# ================= APP FACTORY =================
+# Importing this module only defines routes; it doesn't touch the database
+# or the filesystem. Production servers call the factory and expect
+# `flask migrate` to have run first, e.g.
+#
+#     flask --app app migrate
+#     gunicorn -w 4 'app:create_app()'
+#
+# so workers start with a single read of user_version. Servers that import
+# `app` directly (`flask --app app run`) get the same checks from
+# ensure_app_ready() on their first request.
+_app_ready = False
+_app_ready_lock = threading.Lock()
+
+
+def create_app(database=None, migrate=False):
+    global DATABASE, SEARCH_ENABLED, LIVE_UPDATES, _app_ready
+
+    if database:
+        DATABASE = database
+    os.makedirs(UPLOAD_FOLDER, exist_ok=True)
+    if Image is not None:
+        os.makedirs(THUMB_FOLDER, exist_ok=True)
+    load_asset_manifest()
+
+    LIVE_UPDATES = live_updates_enabled()
+
+    if migrate:
+        migrate_all()
+
+    for path, migrations in migration_targets():
+        expected = migrations[-1][0]
+        if not os.path.exists(path):
+            raise RuntimeError(f"{path} doesn't exist; run `flask --app app migrate`")
+
+        conn = _connect(path=path)
+        try:
+            version = schema_version(conn)
+        finally:
+            conn.close()
+        if version < expected:
+            raise RuntimeError(
+                f"{path} is at schema version {version}, expected "
+                f"{expected}; run `flask --app app migrate`"
+            )
+
+    conn = _connect()
+    try:
+        SEARCH_ENABLED = conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE name = 'expenses_fts'"
+        ).fetchone() is not None
+    finally:
+        conn.close()
+
+    _app_ready = True
+    return app
+
+
+@app.before_request
+def ensure_app_ready():
+    if _app_ready:
+        return
+    with _app_ready_lock:
+        if not _app_ready:
+            create_app()   # raises (500) until `flask migrate` has run
+
+
 if __name__ == "__main__":
-    app.run(debug=True)
+    create_app(migrate=True).run(debug=True)
   
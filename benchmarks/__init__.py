@@ -0,0 +1,15 @@
+"""
+Offline benchmarks for the hot routes and helpers in app.py.
+
+Run from the repo root:
+
+    python -m benchmarks.run --rows 1000 100000 1000000 --out bench.json
+    python -m benchmarks.run --rows 1000 --compare bench.json
+    python -m benchmarks.login_storm --clients 8
+    python -m benchmarks.startup
+    python -m benchmarks.savings_check --rows 2000 20000 200000
+    python -m benchmarks.shard_writers --writers 8 --shards 0 2 4 8
+
+Everything runs against a throwaway database in a temp directory
+(FINANCE_DB), never instance/database.db.
+"""
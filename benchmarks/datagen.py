@@ -0,0 +1,71 @@
+"""
+Deterministic synthetic ledger: N users x M transactions spread across
+several years and the same categories/sources the forms offer.
+"""
+import random
+from datetime import date, timedelta
+
+EXPENSE_CATEGORIES = [
+    "Food", "Rent", "Travel", "Shopping", "Bills",
+    "Health", "Education", "Entertainment", "Other"
+]
+INCOME_SOURCES = ["Salary", "Freelance", "Business", "Investment", "Gift"]
+
+INCOME_SHARE = 0.2   # roughly 1 in 5 transactions is income
+BATCH_SIZE = 5000
+
+
+def generate(conn, users, tx_per_user, years=3, seed=42, end=date(2026, 1, 1)):
+    """
+    Insert `users` users with `tx_per_user` transactions each.
+    Returns:
+    - list of the generated user ids
+    """
+    rng = random.Random(seed)
+    start = end - timedelta(days=365 * years)
+    span = (end - start).days
+
+    user_ids = []
+    for n in range(users):
+        cur = conn.execute(
+            "INSERT INTO users (name, email, password) VALUES (?, ?, ?)",
+            (f"Bench {n}", f"bench{seed}-{n}@example.com", "!bench")
+        )
+        user_ids.append(cur.lastrowid)
+    conn.commit()
+
+    incomes, expenses = [], []
+
+    def flush():
+        conn.executemany("""
+            INSERT INTO income (user_id, source, amount, date, description)
+            VALUES (?, ?, ?, ?, ?)
+        """, incomes)
+        conn.executemany("""
+            INSERT INTO expenses (user_id, amount, category, date, note)
+            VALUES (?, ?, ?, ?, ?)
+        """, expenses)
+        conn.commit()
+        incomes.clear()
+        expenses.clear()
+
+    for user_id in user_ids:
+        for i in range(tx_per_user):
+            day = (start + timedelta(days=rng.randrange(span))).isoformat()
+
+            if rng.random() < INCOME_SHARE:
+                incomes.append((
+                    user_id, rng.choice(INCOME_SOURCES),
+                    round(rng.uniform(1000, 80000), 2), day, f"income {i}"
+                ))
+            else:
+                expenses.append((
+                    user_id, round(rng.uniform(10, 5000), 2),
+                    rng.choice(EXPENSE_CATEGORIES), day, f"expense {i}"
+                ))
+
+            if len(incomes) + len(expenses) >= BATCH_SIZE:
+                flush()
+
+    flush()
+    return user_ids
@@ -0,0 +1,104 @@
+"""
+Dashboard latency while other clients hammer /login.
+
+Measures /dashboard-data p50/p95 on its own, then again while `--clients`
+threads POST valid logins in a loop, once with password hashing inline
+(FINANCE_HASH_WORKERS=0 behaviour) and once through the process pool.
+
+    python -m benchmarks.login_storm --rows 10000 --clients 8
+"""
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+
+from benchmarks import datagen
+from benchmarks.run import load_app, percentile, use_database
+
+PASSWORD = "bench-password"
+
+
+def dashboard_latency(app_module, user_id, requests):
+    client = app_module.app.test_client()
+    with client.session_transaction() as s:
+        s["user_id"] = user_id
+
+    times = []
+    for _ in range(requests):
+        app_module.aggregate_cache.clear()
+        start = time.perf_counter()
+        resp = client.get("/dashboard-data")
+        resp.get_data()
+        times.append((time.perf_counter() - start) * 1000)
+        assert resp.status_code == 200, resp.status_code
+
+    return round(percentile(times, 50), 2), round(percentile(times, 95), 2)
+
+
+def storm(app_module, email, clients, stop, counts):
+    def login_loop():
+        client = app_module.app.test_client()
+        while not stop.is_set():
+            resp = client.post("/login", data={"email": email, "password": PASSWORD})
+            counts[resp.status_code] = counts.get(resp.status_code, 0) + 1
+
+    threads = [threading.Thread(target=login_loop, daemon=True) for _ in range(clients)]
+    for t in threads:
+        t.start()
+    return threads
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", type=int, default=10000)
+    parser.add_argument("--clients", type=int, default=8)
+    parser.add_argument("--requests", type=int, default=50)
+    args = parser.parse_args(argv)
+
+    workdir = tempfile.mkdtemp(prefix="finance-bench-")
+    try:
+        app_module, _ = load_app(workdir)
+        app_module.send_email = lambda *a, **kw: None
+
+        path = os.path.join(workdir, "storm.db")
+        shutil.copy(os.environ["FINANCE_DB"], path)
+        use_database(app_module, path)
+
+        conn = app_module._connect()
+        user_id = datagen.generate(conn, 1, args.rows)[0]
+        email = conn.execute("SELECT email FROM users WHERE id = ?", (user_id,)).fetchone()[0]
+        conn.execute(
+            "UPDATE users SET password = ? WHERE id = ?",
+            (app_module.generate_password_hash(PASSWORD, app_module.PASSWORD_METHOD), user_id)
+        )
+        conn.commit()
+        conn.close()
+
+        p50, p95 = dashboard_latency(app_module, user_id, args.requests)
+        print(f"{'idle':<24} p50 {p50:>8.2f} ms   p95 {p95:>8.2f} ms")
+
+        workers = app_module.PASSWORD_WORKERS or 1
+        for label, n in (("storm, inline hashing", 0), (f"storm, pool x{workers}", workers)):
+            app_module.PASSWORD_WORKERS = n
+            stop = threading.Event()
+            counts = {}
+            threads = storm(app_module, email, args.clients, stop, counts)
+            time.sleep(0.5)   # let the storm ramp up
+
+            p50, p95 = dashboard_latency(app_module, user_id, args.requests)
+
+            stop.set()
+            for t in threads:
+                t.join()
+            print(f"{label:<24} p50 {p50:>8.2f} ms   p95 {p95:>8.2f} ms   logins {counts}")
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
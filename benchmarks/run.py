@@ -0,0 +1,204 @@
+"""
+Benchmark the hot routes (through the Flask test client) and helpers
+(called directly) at several ledger sizes.
+
+Reports p50/p95 latency in ms and SQL statements per call, writes the
+results as JSON and can compare against a previous results file.
+"""
+import argparse
+import json
+import os
+import platform
+import shutil
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+
+from benchmarks import datagen
+
+ROUTES = [
+    "/dashboard-data",
+    "/financial-analytics",
+    "/api/savings/month",
+    "/api/savings/6months",
+    "/api/savings/year",
+    "/expense-management",
+    "/savings",
+    "/income",
+]
+
+HELPERS = ["get_monthly_savings", "get_monthly_financials"]
+
+
+def percentile(values, pct):
+    values = sorted(values)
+    index = round(pct / 100 * (len(values) - 1))
+    return values[index]
+
+
+def load_app(workdir):
+    """Import app.py against an empty, migrated database inside workdir."""
+    os.environ["FINANCE_DB"] = os.path.join(workdir, "template.db")
+    import app as app_module
+    app_module.create_app(migrate=True)
+
+    # Count every statement run on pooled connections
+    counter = {"queries": 0}
+    connect = app_module._connect
+
+    def counting_connect(*args, **kwargs):
+        conn = connect(*args, **kwargs)
+        conn.set_trace_callback(lambda sql: counter.__setitem__("queries", counter["queries"] + 1))
+        return conn
+
+    app_module._connect = counting_connect
+    return app_module, counter
+
+
+def use_database(app_module, path):
+    """Point the app at a different database file and drop pooled connections."""
+    for pool in app_module._db_pools.values():
+        while not pool.empty():
+            pool.get_nowait().close()
+    app_module.DATABASE = path
+    app_module.aggregate_cache.clear()
+
+
+def measure(fn, iterations, counter, reset_cache):
+    times = []
+    queries = []
+
+    for _ in range(iterations):
+        reset_cache()
+        counter["queries"] = 0
+        start = time.perf_counter()
+        fn()
+        times.append((time.perf_counter() - start) * 1000)
+        queries.append(counter["queries"])
+
+    return {
+        "p50_ms": round(percentile(times, 50), 3),
+        "p95_ms": round(percentile(times, 95), 3),
+        "queries": max(queries),
+    }
+
+
+def bench_size(app_module, counter, workdir, rows, users, iterations, warm):
+    path = os.path.join(workdir, f"bench_{rows}.db")
+    shutil.copy(os.environ["FINANCE_DB"], path)
+    use_database(app_module, path)
+
+    conn = app_module._connect()
+    started = time.perf_counter()
+    user_ids = datagen.generate(conn, users, max(1, rows // users))
+    generate_s = time.perf_counter() - started
+    conn.close()
+
+    user_id = user_ids[0]
+    reset_cache = (lambda: None) if warm else app_module.aggregate_cache.clear
+
+    client = app_module.app.test_client()
+    with client.session_transaction() as s:
+        s["user_id"] = user_id
+
+    results = {}
+
+    for route in ROUTES:
+        def call(route=route):
+            resp = client.get(route)
+            assert resp.status_code == 200, (route, resp.status_code)
+            resp.get_data()
+
+        results[f"route {route}"] = measure(call, iterations, counter, reset_cache)
+
+    for name in HELPERS:
+        helper = getattr(app_module, name)
+
+        def call(helper=helper):
+            with app_module.app.app_context():
+                helper(user_id)
+
+        results[f"helper {name}"] = measure(call, iterations, counter, reset_cache)
+
+    print(f"\n== {rows} rows ({users} users), generated in {generate_s:.1f}s ==")
+    for key, r in results.items():
+        print(f"{key:<36} p50 {r['p50_ms']:>9.2f} ms   p95 {r['p95_ms']:>9.2f} ms   {r['queries']:>3} queries")
+
+    use_database(app_module, os.environ["FINANCE_DB"])
+    os.remove(path)
+    return results
+
+
+def compare(current, previous):
+    print("\n== compared with previous run (p50 ratio, <1 is faster) ==")
+    for size, results in current["results"].items():
+        old = previous.get("results", {}).get(size)
+        if not old:
+            continue
+        for key, r in results.items():
+            if key in old and old[key]["p50_ms"]:
+                ratio = r["p50_ms"] / old[key]["p50_ms"]
+                print(f"{size:>8} {key:<36} {old[key]['p50_ms']:>9.2f} -> {r['p50_ms']:>9.2f} ms  x{ratio:.2f}")
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"], stderr=subprocess.DEVNULL, text=True
+        ).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", type=int, nargs="+", default=[1000, 100000, 1000000])
+    parser.add_argument("--users", type=int, default=10)
+    parser.add_argument("--iterations", type=int, default=30)
+    parser.add_argument("--warm", action="store_true",
+                        help="keep the aggregate cache between iterations")
+    parser.add_argument("--out", help="write results JSON here")
+    parser.add_argument("--compare", help="previous results JSON to compare against")
+    args = parser.parse_args(argv)
+
+    workdir = tempfile.mkdtemp(prefix="finance-bench-")
+    try:
+        app_module, counter = load_app(workdir)
+
+        output = {
+            "meta": {
+                "timestamp": datetime.now(timezone.utc).isoformat(),
+                "revision": git_revision(),
+                "python": platform.python_version(),
+                "sqlite": sqlite3.sqlite_version,
+                "users": args.users,
+                "iterations": args.iterations,
+                "warm": args.warm,
+            },
+            "results": {},
+        }
+
+        for rows in args.rows:
+            output["results"][str(rows)] = bench_size(
+                app_module, counter, workdir, rows, args.users, args.iterations, args.warm
+            )
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(output, f, indent=2)
+        print(f"\nResults written to {args.out}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            compare(output, json.load(f))
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
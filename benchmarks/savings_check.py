@@ -0,0 +1,100 @@
+"""
+Regression check for get_monthly_savings on large synthetic ledgers.
+
+For each size, generates one user's ledger with datagen, compares the
+monthly savings against a plain Python sum over the raw rows, and times
+the call. Fails (exit 1) if any month is off by more than a paisa, or if
+runtime grows faster than the row count between the smallest and largest
+size (with --slack for timer noise).
+
+    python -m benchmarks.savings_check --rows 2000 20000 200000
+"""
+import argparse
+import os
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+from collections import defaultdict
+
+from benchmarks import datagen
+from benchmarks.run import load_app, use_database
+
+
+def reference_savings(conn, user_id):
+    savings = defaultdict(float)
+    for r in conn.execute("SELECT date, amount FROM income WHERE user_id = ?", (user_id,)):
+        savings[r[0][:7]] += r[1]
+    for r in conn.execute("SELECT date, amount FROM expenses WHERE user_id = ?", (user_id,)):
+        savings[r[0][:7]] -= r[1]
+    return dict(sorted(savings.items()))
+
+
+def check_size(app_module, workdir, rows, iterations):
+    path = os.path.join(workdir, f"savings_{rows}.db")
+    shutil.copy(os.environ["FINANCE_DB"], path)
+    use_database(app_module, path)
+
+    conn = app_module._connect()
+    user_id = datagen.generate(conn, 1, rows)[0]
+    expected = reference_savings(conn, user_id)
+    conn.close()
+
+    times = []
+    for _ in range(iterations):
+        with app_module.app.app_context():
+            start = time.perf_counter()
+            labels, values = app_module.get_monthly_savings(user_id)
+            times.append(time.perf_counter() - start)
+
+    actual = dict(zip(labels, values))
+    errors = []
+    if list(actual) != list(expected):
+        errors.append(f"months differ: {list(actual)} != {list(expected)}")
+    for month, value in expected.items():
+        if month in actual and abs(actual[month] - value) > 0.01:
+            errors.append(f"{month}: {actual[month]} != {value:.2f}")
+
+    use_database(app_module, os.environ["FINANCE_DB"])
+    os.remove(path)
+    return statistics.median(times), errors
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", type=int, nargs="+", default=[2000, 20000, 200000])
+    parser.add_argument("--iterations", type=int, default=20)
+    parser.add_argument("--slack", type=float, default=2.0,
+                        help="allowed factor over linear growth")
+    args = parser.parse_args(argv)
+
+    workdir = tempfile.mkdtemp(prefix="finance-bench-")
+    failed = False
+    try:
+        app_module, _ = load_app(workdir)
+
+        timings = {}
+        for rows in sorted(args.rows):
+            median, errors = check_size(app_module, workdir, rows, args.iterations)
+            timings[rows] = median
+            status = "ok" if not errors else f"{len(errors)} wrong months"
+            print(f"{rows:>9} rows   median {median * 1000:>8.2f} ms   totals {status}")
+            for e in errors[:10]:
+                print(f"    {e}")
+            failed |= bool(errors)
+
+        small, large = min(timings), max(timings)
+        if large > small:
+            growth = timings[large] / timings[small]
+            limit = large / small * args.slack
+            print(f"runtime x{growth:.2f} for x{large / small:.0f} rows (limit x{limit:.0f})")
+            failed |= growth > limit
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
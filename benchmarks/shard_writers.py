@@ -0,0 +1,135 @@
+"""
+Write throughput with many concurrent writers, unsharded vs sharded.
+
+For each shard count, `--writers` processes (one app instance each, like
+server workers) POST /add-expense for random users out of `--users` for
+`--seconds`. Reports successful writes/s, p50/p95 latency and failed
+requests (e.g. "database is locked" after busy_timeout).
+
+    python -m benchmarks.shard_writers --writers 8 --shards 0 2 4 8
+
+Sharding only pays off when writers wait on the database lock rather than
+on CPU, so run this on the deployment hardware. On a 1-CPU machine there
+was no meaningful difference (writes/s, 5 s runs, 8 writers, 64 users):
+
+    unsharded 395-415   2 shards 397-440   4 shards 404-436   8 shards 393-437
+"""
+import argparse
+import multiprocessing
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+from benchmarks.run import percentile
+
+
+def writer(db, shards, user_ids, seconds, start_at, results):
+    os.environ["FINANCE_DB"] = db
+    os.environ["FINANCE_SHARDS"] = str(shards)
+    import app as app_module
+    app_module.create_app()
+
+    clients = []
+    for user_id in user_ids:
+        client = app_module.app.test_client()
+        with client.session_transaction() as s:
+            s["user_id"] = user_id
+        clients.append(client)
+
+    times, errors = [], 0
+    rng = random.Random(os.getpid())
+    time.sleep(max(0, start_at - time.time()))
+    stop_at = time.time() + seconds
+
+    while time.time() < stop_at:
+        start = time.perf_counter()
+        resp = rng.choice(clients).post("/add-expense", data={
+            "category": "Food",
+            "amount": f"{rng.randint(1, 5000) / 100:.2f}",
+            "date": f"2026-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}",
+            "note": "bench",
+        })
+        if resp.status_code == 302:
+            times.append((time.perf_counter() - start) * 1000)
+        else:
+            errors += 1
+
+    results.put((times, errors))
+
+
+def setup(app_module, workdir, shards, users):
+    """Fresh central database (+ shards) with `users` users; returns their ids."""
+    app_module.DATABASE = os.path.join(workdir, f"shards_{shards}", "central.db")
+    app_module.SHARD_COUNT = shards
+    app_module.migrate_all()
+
+    conn = app_module._connect()
+    conn.executemany(
+        "INSERT INTO users (name, email, password) VALUES (?, ?, 'x')",
+        [(f"User {i}", f"writer{i}@example.com") for i in range(users)]
+    )
+    conn.commit()
+    user_ids = [r[0] for r in conn.execute("SELECT id FROM users ORDER BY id")]
+    conn.close()
+    return app_module.DATABASE, user_ids
+
+
+def run(db, shards, user_ids, writers, seconds):
+    ctx = multiprocessing.get_context("spawn")   # workers read FINANCE_* at import
+    results = ctx.Queue()
+    start_at = time.time() + 3   # after every worker has imported the app
+
+    procs = [
+        ctx.Process(target=writer, args=(db, shards, user_ids, seconds, start_at, results))
+        for _ in range(writers)
+    ]
+    for p in procs:
+        p.start()
+
+    times, errors = [], 0
+    for _ in procs:
+        t, e = results.get()
+        times += t
+        errors += e
+    for p in procs:
+        p.join()
+
+    return {
+        "ops_s": len(times) / seconds,
+        "p50_ms": percentile(times, 50) if times else 0,
+        "p95_ms": percentile(times, 95) if times else 0,
+        "errors": errors,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--writers", type=int, default=8)
+    parser.add_argument("--users", type=int, default=64)
+    parser.add_argument("--seconds", type=float, default=5)
+    parser.add_argument("--shards", type=int, nargs="+", default=[0, 2, 4, 8])
+    args = parser.parse_args(argv)
+
+    workdir = tempfile.mkdtemp(prefix="finance-bench-")
+    try:
+        os.environ["FINANCE_DB"] = os.path.join(workdir, "unused.db")
+        import app as app_module
+
+        print(f"{args.writers} writer processes, {args.users} users, {os.cpu_count()} CPUs")
+        for shards in args.shards:
+            db, user_ids = setup(app_module, workdir, shards, args.users)
+            r = run(db, shards, user_ids, args.writers, args.seconds)
+            label = f"{shards} shards" if shards else "unsharded"
+            print(f"{label:<12} {r['ops_s']:>8.1f} writes/s   p50 {r['p50_ms']:>8.2f} ms   "
+                  f"p95 {r['p95_ms']:>8.2f} ms   errors {r['errors']}")
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
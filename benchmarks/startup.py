@@ -0,0 +1,71 @@
+"""
+Cold-start costs, each measured in a fresh interpreter:
+
+- import:      `import app` (no database or filesystem work)
+- create_app:  import + create_app() against an up-to-date database,
+               i.e. what every server worker pays
+- migrate:     `flask migrate` equivalent on an empty database
+- migrate-noop: the same against an up-to-date database
+
+    python -m benchmarks.startup --runs 10
+"""
+import argparse
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+
+SNIPPETS = {
+    "import": "import app",
+    "create_app": "import app; app.create_app()",
+    "migrate": "import app; c = app._connect(); app.run_migrations(c)",
+    "migrate-noop": "import app; c = app._connect(); app.run_migrations(c)",
+}
+
+TIMER = """
+import time
+_start = time.perf_counter()
+{code}
+print((time.perf_counter() - _start) * 1000)
+"""
+
+
+def run_once(code, db):
+    env = dict(os.environ, FINANCE_DB=db)
+    out = subprocess.check_output(
+        [sys.executable, "-c", TIMER.format(code=code)],
+        env=env, text=True, stderr=subprocess.DEVNULL
+    )
+    return float(out.strip().splitlines()[-1])
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--runs", type=int, default=10)
+    args = parser.parse_args(argv)
+
+    workdir = tempfile.mkdtemp(prefix="finance-bench-")
+    try:
+        ready = os.path.join(workdir, "ready.db")
+        run_once(SNIPPETS["migrate"], ready)
+
+        for name, code in SNIPPETS.items():
+            times = []
+            for i in range(args.runs):
+                db = ready
+                if name == "migrate":
+                    db = os.path.join(workdir, f"fresh_{i}.db")
+                times.append(run_once(code, db))
+
+            print(f"{name:<14} median {statistics.median(times):>8.1f} ms   "
+                  f"min {min(times):>8.1f} ms   max {max(times):>8.1f} ms")
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,38 @@
+// LIVE UPDATES (Server-Sent Events from /events)
+//
+// liveUpdates({ totals: fn, transaction: fn, ... }, onResync)
+// Each handler gets the parsed JSON payload of its event. onResync runs when
+// the server asks for a full refresh and after a dropped stream reconnects,
+// since events may have been missed in between.
+function liveUpdates(handlers, onResync) {
+    if (!window.EventSource) return null;
+
+    const source = new EventSource("/events");
+    let dropped = false;
+
+    Object.entries(handlers).forEach(([event, handler]) => {
+        source.addEventListener(event, e => handler(JSON.parse(e.data)));
+    });
+
+    source.addEventListener("resync", () => {
+        if (onResync) onResync();
+    });
+
+    // EventSource reconnects on its own; just note that we may have missed
+    // something and refresh once it's back.
+    source.onerror = () => { dropped = true; };
+    source.onopen = () => {
+        if (dropped && onResync) onResync();
+        dropped = false;
+    };
+
+    return source;
+}
+
+// Fallback when the server has live updates switched off: refresh whenever
+// the tab becomes visible again.
+function refreshOnFocus(onRefresh) {
+    document.addEventListener("visibilitychange", () => {
+        if (!document.hidden) onRefresh();
+    });
+}